@@ -0,0 +1,169 @@
+"""
+setBasicConfig 压测, 使用本地 MockBinanceServer, 不访问真实网络
+
+    比较 4 种模式 的 symbols/s, 请求延迟 p50 / p99, 请求数, 新建连接数:
+        sequential: 原始实现, 每个请求单独 requests.post (每次新建连接)
+        pooled:     BinanceClient 连接池, 顺序执行
+        concurrent: BinanceClient 连接池, --workers 并发
+        reconcile:  先读后写 + 并发, 账户已是目标配置 (日常运行的情况)
+
+    python bench/bench_set_basic_config.py --symbols 300 --latency 0.02 --connect-latency 0.05 --workers 16
+"""
+
+import os
+import sys
+import io
+import time
+import hmac
+import hashlib
+import logging
+import argparse
+import contextlib
+from urllib.parse import urlencode
+
+import requests
+
+PATH_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PATH_ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bntools import BinanceClient, SymbolChange, fetch_symbols_state, diff_symbols
+from setBasicConfig import set_symbols_config
+from mock_binance import MockBinanceServer
+
+
+API_KEY = 'bench-key'
+SECRET_KEY = 'bench-secret'
+MARGIN_TYPE = 'ISOLATED'
+LEVERAGE = 10
+USE_HEDGE = True
+
+MODES = ['sequential', 'pooled', 'concurrent', 'reconcile']
+
+
+class TimedBinanceClient(BinanceClient):
+    """
+    记录每个请求的耗时
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def _request(self, *args, **kwargs):
+        t = time.perf_counter()
+        try:
+            return super()._request(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - t)
+
+
+def _legacy_post(base_url, method_url, params: dict, latencies: list):
+    # 与原 setBasicConfig 相同: 每次请求 重新签名, 单独 requests.post
+    t = time.perf_counter()
+    params['timestamp'] = int(time.time() * 1000)
+    query_string = urlencode(params)
+    params['signature'] = hmac.new(SECRET_KEY.encode('utf-8'), query_string.encode('utf-8'), hashlib.sha256).hexdigest()
+    requests.post(base_url + method_url, headers={'X-MBX-APIKEY': API_KEY}, params=params)
+    latencies.append(time.perf_counter() - t)
+
+
+def run_sequential(server: MockBinanceServer, d_symbols: dict) -> list:
+    latencies = []
+    for exchange, symbols in d_symbols.items():
+        base_url = server.base_urls[exchange]
+        for symbol in symbols:
+            _legacy_post(base_url, '/v1/marginType', {'symbol': symbol, 'marginType': MARGIN_TYPE}, latencies)
+            _legacy_post(base_url, '/v1/leverage', {'symbol': symbol, 'leverage': LEVERAGE}, latencies)
+        _legacy_post(base_url, '/v1/positionSide/dual', {'dualSidePosition': 'true' if USE_HEDGE else 'false'},
+                     latencies)
+    return latencies
+
+
+def run_client(server: MockBinanceServer, d_symbols: dict, workers, reconcile) -> list:
+    logger = logging.Logger(name='bench')
+    client = TimedBinanceClient(
+        api_key=API_KEY, secret_key=SECRET_KEY, base_urls=server.base_urls,
+        pool_size=max(10, workers), time_sync_interval=0, logger=logger,
+    )
+    with client:
+        for exchange, symbols in d_symbols.items():
+            need_position_mode = True
+            if reconcile:
+                changes = diff_symbols(
+                    fetch_symbols_state(client, exchange), symbols, margin_type=MARGIN_TYPE, leverage=LEVERAGE)
+                need_position_mode = client.get_position_mode(exchange) != USE_HEDGE
+            else:
+                changes = [SymbolChange(symbol=symbol, margin_type=MARGIN_TYPE, leverage=LEVERAGE) for symbol in symbols]
+            d_error = set_symbols_config(client, exchange, changes, logger=logger, workers=workers)
+            assert not d_error, d_error
+            if need_position_mode:
+                client.set_position_mode(exchange, use_hedge_mode=USE_HEDGE)
+    return client.latencies
+
+
+def _percentile(values: list, p) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def bench(mode, args) -> dict:
+    server = MockBinanceServer(
+        accounts={API_KEY: SECRET_KEY},
+        symbols_num={'USDM': args.symbols, 'CoinM': args.coinm_symbols},
+        latency=args.latency, latency_jitter=args.latency_jitter, connect_latency=args.connect_latency,
+        weight_limit=args.weight_limit, error_429_rate=args.error_429_rate,
+    )
+    d_symbols = {market: [s['symbol'] for s in l_info] for market, l_info in server.exchange_info.items()}
+    n_symbols = sum(len(symbols) for symbols in d_symbols.values())
+    with server, contextlib.redirect_stdout(io.StringIO()):
+        if mode == 'reconcile':
+            # 先修改为目标配置 (不计时), 再测 日常运行
+            run_client(server, d_symbols, workers=args.workers, reconcile=False)
+            server.reset_stats()
+
+        t = time.perf_counter()
+        if mode == 'sequential':
+            latencies = run_sequential(server, d_symbols)
+        elif mode == 'pooled':
+            latencies = run_client(server, d_symbols, workers=1, reconcile=False)
+        elif mode == 'concurrent':
+            latencies = run_client(server, d_symbols, workers=args.workers, reconcile=False)
+        else:
+            latencies = run_client(server, d_symbols, workers=args.workers, reconcile=True)
+        elapsed = time.perf_counter() - t
+
+    return {
+        'mode': mode,
+        'symbols': n_symbols,
+        'seconds': elapsed,
+        'symbols_per_s': n_symbols / elapsed,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+        'requests': sum(server.request_count.values()),
+        'connections': server.connection_count,
+        'status_429': server.status_count[429],
+    }
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    arg_parser.add_argument('--symbols', type=int, default=300, help='USDM 永续合约数量')
+    arg_parser.add_argument('--coinm-symbols', type=int, default=30, help='CoinM 永续合约数量')
+    arg_parser.add_argument('--workers', type=int, default=16)
+    arg_parser.add_argument('--latency', type=float, default=0.02, help='每个请求的服务器延迟 (s)')
+    arg_parser.add_argument('--latency-jitter', type=float, default=0.01)
+    arg_parser.add_argument('--connect-latency', type=float, default=0.05, help='每个新连接的握手延迟 (s)')
+    arg_parser.add_argument('--weight-limit', type=int, default=2400)
+    arg_parser.add_argument('--error-429-rate', type=float, default=0.)
+    args = arg_parser.parse_args()
+
+    print(f'{"mode":<12}{"symbols":>8}{"seconds":>10}{"sym/s":>10}{"p50 ms":>10}{"p99 ms":>10}'
+          f'{"requests":>10}{"conns":>8}{"429":>6}')
+    for _mode in args.modes:
+        d_result = bench(_mode, args)
+        print(f'{d_result["mode"]:<12}{d_result["symbols"]:>8}{d_result["seconds"]:>10.2f}'
+              f'{d_result["symbols_per_s"]:>10.1f}{d_result["p50_ms"]:>10.1f}{d_result["p99_ms"]:>10.1f}'
+              f'{d_result["requests"]:>10}{d_result["connections"]:>8}{d_result["status_429"]:>6}')
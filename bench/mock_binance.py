@@ -0,0 +1,333 @@
+"""
+本地 模拟 Binance 合约 服务器 (/fapi, /dapi), 用于 测试 / 压测 setBasicConfig, 不访问真实网络
+
+    支持:
+        签名校验 (-1022), timestamp / recvWindow 校验 (-1021)
+        X-MBX-USED-WEIGHT-1M header, 超出 weight 额度时返回 429 + Retry-After
+        随机注入 429, 可配置的 响应延迟
+        marginType / positionSide 无需修改时 返回 "No need to change"
+
+    python bench/mock_binance.py --port 18080
+"""
+
+import hmac
+import hashlib
+import json
+import time
+import random
+import threading
+import argparse
+from collections import defaultdict, Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+from typing import Dict, List
+
+
+# { 路径前缀: 市场 }
+MARKET_PREFIX = {
+    '/fapi': 'USDM',
+    '/dapi': 'CoinM',
+}
+
+# { (market, http method, path): weight }
+ENDPOINT_WEIGHT = {
+    ('USDM', 'GET', '/v1/time'): 1,
+    ('USDM', 'GET', '/v1/exchangeInfo'): 1,
+    ('USDM', 'GET', '/v1/leverageBracket'): 1,
+    ('USDM', 'GET', '/v2/positionRisk'): 5,
+    ('USDM', 'GET', '/v1/positionSide/dual'): 30,
+    ('USDM', 'POST', '/v1/positionSide/dual'): 1,
+    ('USDM', 'POST', '/v1/marginType'): 1,
+    ('USDM', 'POST', '/v1/leverage'): 1,
+    ('CoinM', 'GET', '/v1/time'): 1,
+    ('CoinM', 'GET', '/v1/exchangeInfo'): 1,
+    ('CoinM', 'GET', '/v2/leverageBracket'): 1,
+    ('CoinM', 'GET', '/v1/positionRisk'): 1,
+    ('CoinM', 'GET', '/v1/positionSide/dual'): 30,
+    ('CoinM', 'POST', '/v1/positionSide/dual'): 1,
+    ('CoinM', 'POST', '/v1/marginType'): 1,
+    ('CoinM', 'POST', '/v1/leverage'): 1,
+}
+
+UNSIGNED_PATHS = ['/v1/time', '/v1/exchangeInfo']
+
+
+def gen_symbols(market, n) -> List[dict]:
+    """
+    生成 n 个 永续合约, 格式同 exchangeInfo symbols
+    """
+    l_symbol = []
+    for i in range(n):
+        base = f'C{i:03d}'
+        if market == 'USDM':
+            quote, margin, symbol = 'USDT', 'USDT', f'{base}USDT'
+        else:
+            quote, margin, symbol = 'USD', base, f'{base}USD_PERP'
+        l_symbol.append({
+            'symbol': symbol, 'pair': f'{base}{quote}', 'contractType': 'PERPETUAL', 'deliveryDate': 4133404800000,
+            'baseAsset': base, 'quoteAsset': quote, 'marginAsset': margin,
+            'status': 'TRADING', 'contractStatus': 'TRADING',
+        })
+    return l_symbol
+
+
+class _AccountState:
+    def __init__(self, d_symbols: Dict[str, List[str]]):
+        self.lock = threading.Lock()
+        # { market: bool }
+        self.dual_side = {market: False for market in d_symbols}
+        # { market: { symbol: {'leverage': , 'marginType': } } }
+        self.symbols = {
+            market: {symbol: {'leverage': 20, 'marginType': 'CROSSED'} for symbol in l_symbol}
+            for market, l_symbol in d_symbols.items()
+        }
+
+
+class MockBinanceServer:
+    def __init__(
+            self,
+            accounts: Dict[str, str],
+            symbols_num: Dict[str, int] or None = None,
+            host='127.0.0.1', port=0,
+            latency=0., latency_jitter=0.,
+            connect_latency=0.,
+            weight_limit=2400,
+            error_429_rate=0.,
+            retry_after=1,
+            time_offset_ms=0,
+    ):
+        """
+        :param accounts: { api key: secret }
+        :param symbols_num: { market: 永续合约数量 }
+        :param latency: 每个请求的 固定延迟 (s)
+        :param latency_jitter: 随机附加延迟 上限 (s)
+        :param connect_latency: 每个新连接的 额外延迟 (s), 模拟 TCP + TLS 握手
+        :param weight_limit: 每分钟 weight 额度 (按市场统计)
+        :param error_429_rate: 随机返回 429 的概率
+        :param retry_after: 429 时 Retry-After (s)
+        :param time_offset_ms: 服务器时间 相对本地时间的偏差, 用于测试 时间同步
+        """
+        self.accounts = dict(accounts)
+        symbols_num = symbols_num or {'USDM': 300, 'CoinM': 30}
+        self.exchange_info = {market: gen_symbols(market, n) for market, n in symbols_num.items()}
+        d_symbols = {market: [s['symbol'] for s in l_info] for market, l_info in self.exchange_info.items()}
+        self.account_state = {api_key: _AccountState(d_symbols) for api_key in self.accounts}
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.connect_latency = connect_latency
+        self.weight_limit = weight_limit
+        self.error_429_rate = error_429_rate
+        self.retry_after = retry_after
+        self.time_offset_ms = time_offset_ms
+
+        self._lock = threading.Lock()
+        # { market: (minute, used weight) }
+        self._used_weight: Dict[str, list] = defaultdict(lambda: [0, 0])
+        self.request_count = Counter()
+        self.status_count = Counter()
+        self.connection_count = 0
+
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread or None = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    @property
+    def base_urls(self) -> Dict[str, str]:
+        host = self._httpd.server_address[0]
+        return {market: f'http://{host}:{self.port}{prefix}' for prefix, market in MARKET_PREFIX.items()}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='MockBinanceServer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self.request_count.clear()
+            self.status_count.clear()
+            self.connection_count = 0
+            self._used_weight.clear()
+
+    def server_time(self) -> int:
+        return int(time.time() * 1000 + self.time_offset_ms)
+
+    def _use_weight(self, market, weight) -> int:
+        minute = int(time.time() // 60)
+        with self._lock:
+            used = self._used_weight[market]
+            if used[0] != minute:
+                used[0], used[1] = minute, 0
+            used[1] += weight
+            return used[1]
+
+    def _make_handler(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # header 与 body 分开写入, 不关闭 Nagle 会叠加 delayed ACK 的 40ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                with server._lock:
+                    server.connection_count += 1
+                if server.connect_latency:
+                    time.sleep(server.connect_latency)
+                super().setup()
+
+            def _send(self, status, data, headers: dict or None = None):
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, str(v))
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.status_count[status] += 1
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def _handle(self, http_method):
+                if server.latency or server.latency_jitter:
+                    time.sleep(server.latency + random.random() * server.latency_jitter)
+                parts = urlsplit(self.path)
+                prefix, _, path = parts.path[1:].partition('/')
+                market = MARKET_PREFIX.get('/' + prefix)
+                path = '/' + path
+                weight = ENDPOINT_WEIGHT.get((market, http_method, path))
+                if weight is None:
+                    return self._send(404, {'code': -1000, 'msg': f'unknown path {parts.path}'})
+                with server._lock:
+                    server.request_count[(market, http_method, path)] += 1
+
+                used_weight = server._use_weight(market, weight)
+                headers = {'X-MBX-USED-WEIGHT-1M': used_weight}
+                if used_weight > server.weight_limit or random.random() < server.error_429_rate:
+                    headers['Retry-After'] = server.retry_after
+                    return self._send(429, {'code': -1003, 'msg': 'Too many requests.'}, headers)
+
+                params = dict(parse_qsl(parts.query))
+                api_key = None
+                if path not in UNSIGNED_PATHS:
+                    api_key = self.headers.get('X-MBX-APIKEY')
+                    error = self._check_signature(api_key, parts.query, params)
+                    if error:
+                        return self._send(400 if error['code'] != -2015 else 401, error, headers)
+
+                status, data = server._dispatch(market, http_method, path, params, api_key)
+                self._send(status, data, headers)
+
+            def _check_signature(self, api_key, query, params) -> dict or None:
+                secret = server.accounts.get(api_key)
+                if secret is None:
+                    return {'code': -2015, 'msg': 'Invalid API-key, IP, or permissions for action.'}
+                payload, _, signature = query.rpartition('&signature=')
+                expected = hmac.new(secret.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+                if not hmac.compare_digest(expected, signature):
+                    return {'code': -1022, 'msg': 'Signature for this request is not valid.'}
+                recv_window = int(params.get('recvWindow', 5000))
+                timestamp = int(params.get('timestamp', 0))
+                server_time = server.server_time()
+                if timestamp >= server_time + 1000 or server_time - timestamp > recv_window:
+                    return {'code': -1021, 'msg': "Timestamp for this request is outside of the recvWindow."}
+                return None
+
+        return _Handler
+
+    def _dispatch(self, market, http_method, path, params, api_key):
+        if path == '/v1/time':
+            return 200, {'serverTime': self.server_time()}
+        if path == '/v1/exchangeInfo':
+            return 200, {'symbols': self.exchange_info[market]}
+        if path.endswith('/leverageBracket'):
+            return 200, [
+                {'symbol': s['symbol'], 'brackets': [
+                    {'bracket': 1, 'initialLeverage': 50},
+                    {'bracket': 2, 'initialLeverage': 20},
+                ]}
+                for s in self.exchange_info[market]
+            ]
+
+        state = self.account_state[api_key]
+        with state.lock:
+            d_symbol = state.symbols[market]
+            if path.endswith('/positionRisk'):
+                return 200, [
+                    {'symbol': symbol, 'leverage': str(d['leverage']), 'positionSide': 'BOTH',
+                     'marginType': 'cross' if d['marginType'] == 'CROSSED' else 'isolated'}
+                    for symbol, d in d_symbol.items()
+                ]
+            if path == '/v1/positionSide/dual':
+                if http_method == 'GET':
+                    return 200, {'dualSidePosition': state.dual_side[market]}
+                dual_side = params.get('dualSidePosition', '').lower() == 'true'
+                if dual_side == state.dual_side[market]:
+                    return 400, {'code': -4059, 'msg': 'No need to change position side.'}
+                state.dual_side[market] = dual_side
+                return 200, {'code': 200, 'msg': 'success'}
+
+            symbol = params.get('symbol')
+            if symbol not in d_symbol:
+                return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+            if path == '/v1/marginType':
+                margin_type = params.get('marginType', '').upper()
+                if margin_type not in ['CROSSED', 'ISOLATED']:
+                    return 400, {'code': -1102, 'msg': 'Mandatory parameter marginType was not sent.'}
+                if d_symbol[symbol]['marginType'] == margin_type:
+                    return 400, {'code': -4046, 'msg': 'No need to change margin type.'}
+                d_symbol[symbol]['marginType'] = margin_type
+                return 200, {'code': 200, 'msg': 'success'}
+            if path == '/v1/leverage':
+                leverage = int(params.get('leverage', 0))
+                if not 1 <= leverage <= 50:
+                    return 400, {'code': -4028, 'msg': 'Leverage is not valid'}
+                d_symbol[symbol]['leverage'] = leverage
+                return 200, {'symbol': symbol, 'leverage': leverage, 'maxNotionalValue': '1000000'}
+        return 404, {'code': -1000, 'msg': f'unknown path {path}'}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--port', type=int, default=18080)
+    arg_parser.add_argument('--api-key', default='mock-key')
+    arg_parser.add_argument('--secret', default='mock-secret')
+    arg_parser.add_argument('--latency', type=float, default=0.)
+    arg_parser.add_argument('--error-429-rate', type=float, default=0.)
+    args = arg_parser.parse_args()
+
+    mock_server = MockBinanceServer(
+        accounts={args.api_key: args.secret}, port=args.port,
+        latency=args.latency, error_429_rate=args.error_429_rate,
+    )
+    print(f'mock binance server: {mock_server.base_urls}')
+    mock_server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        mock_server.stop()
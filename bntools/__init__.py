@@ -0,0 +1,11 @@
+"""
+
+"""
+
+from .common import BINANCE_BASE_URL
+from .client import BinanceClient, BinanceException
+from .ratelimit import RateLimiter
+from .reconcile import SymbolChange, SymbolState, fetch_symbols_state, diff_symbols
+from .symbols import SymbolRegistry, to_unified_symbol
+from .timesync import TimeSync
+from .signer import HmacSigner
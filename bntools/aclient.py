@@ -0,0 +1,266 @@
+"""
+Binance 合约 异步 REST 客户端 (asyncio + aiohttp)
+
+    与 BinanceClient 相同的接口, 方法均为协程;
+    一个 event loop 内 共用一个 aiohttp 连接池, 可同时修改 多个账户 / USDM + CoinM, 不需要每个请求一个线程
+
+    依赖 aiohttp (已列入 requirements.txt), bntools 默认不导入此模块
+"""
+
+import time
+import asyncio
+import logging
+from urllib.parse import urlencode
+from typing import Dict, List
+
+try:
+    import aiohttp
+except ImportError:
+    raise ImportError('AsyncBinanceClient 需要 aiohttp, 请安装: pip install -r requirements.txt (或 pip install aiohttp)')
+
+from .common import BINANCE_BASE_URL
+from .client import BinanceClient, BinanceException
+from .ratelimit import RateLimiter, parse_retry_after
+from .signer import HmacSigner
+from .reconcile import SymbolChange
+
+
+class AsyncBinanceClient:
+    MARGIN_TYPE_OPTIONS = BinanceClient.MARGIN_TYPE_OPTIONS
+    POSITION_RISK_URL = BinanceClient.POSITION_RISK_URL
+    LEVERAGE_BRACKET_URL = BinanceClient.LEVERAGE_BRACKET_URL
+
+    def __init__(
+            self,
+            api_key, secret_key,
+            base_urls: Dict[str, str] or None = None,
+            pool_size=10,
+            timeout=10,
+            rate_limiter: RateLimiter or None = None,
+            max_limit_retries=5,
+            max_retry_after=300,
+            recv_window: int or None = 5000,
+            time_sync_interval=60 * 5,
+            logger: logging.Logger or None = None,
+    ):
+        """
+        参数含义同 BinanceClient
+        :param pool_size: 连接池 的 最大连接数
+        """
+        self._api_key = api_key
+        self._signer = HmacSigner(secret_key)
+        self._base_urls = dict(BINANCE_BASE_URL if base_urls is None else base_urls)
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        self._max_limit_retries = max_limit_retries
+        self._max_retry_after = max_retry_after
+        self._recv_window = recv_window
+        self._time_sync_interval = time_sync_interval
+        if isinstance(logger, logging.Logger):
+            self.logger = logger
+        else:
+            self.logger = logging.Logger(name='AsyncBinanceClient')
+
+        self._session: aiohttp.ClientSession or None = None
+        # { exchange: offset ms }
+        self._time_offset: Dict[str, float] = {}
+        self._time_sync_lock: asyncio.Lock or None = None
+        self._time_sync_task: asyncio.Task or None = None
+
+    @property
+    def api_key(self) -> str:
+        return self._api_key
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        if self._time_sync_task is not None:
+            self._time_sync_task.cancel()
+            try:
+                await self._time_sync_task
+            except asyncio.CancelledError:
+                pass
+            self._time_sync_task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # session 需要在 event loop 中创建
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_size),
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+                headers={'X-MBX-APIKEY': self._api_key},
+            )
+        return self._session
+
+    def _base_url(self, exchange) -> str:
+        try:
+            return self._base_urls[exchange]
+        except KeyError:
+            raise ValueError(f'unknown exchange: {exchange}, options: {list(self._base_urls.keys())}')
+
+    # 服务器时间 同步
+    async def sync_time(self, exchange) -> float:
+        t_send = time.time()
+        server_time = await self.get_server_time(exchange)
+        t_recv = time.time()
+        offset = server_time - (t_send + t_recv) / 2 * 1000
+        self._time_offset[exchange] = offset
+        self.logger.info(f'time sync, {exchange}, offset {offset:.0f}ms, rtt {(t_recv - t_send) * 1000:.0f}ms')
+        return offset
+
+    async def _time_sync_loop(self):
+        while True:
+            await asyncio.sleep(self._time_sync_interval)
+            for exchange in list(self._time_offset.keys()):
+                try:
+                    await self.sync_time(exchange)
+                except asyncio.CancelledError:
+                    # python3.7 中 CancelledError 是 Exception 的子类, close() 取消时 需要退出
+                    raise
+                except Exception as e:
+                    self.logger.warning(f'time sync fail, {exchange}: {e}')
+
+    async def _timestamp(self, exchange) -> int:
+        if exchange not in self._time_offset:
+            if self._time_sync_lock is None:
+                self._time_sync_lock = asyncio.Lock()
+            async with self._time_sync_lock:
+                if exchange not in self._time_offset:
+                    await self.sync_time(exchange)
+            if self._time_sync_task is None and self._time_sync_interval > 0:
+                self._time_sync_task = asyncio.ensure_future(self._time_sync_loop())
+        return int(time.time() * 1000 + self._time_offset[exchange])
+
+    async def _query_string(self, exchange, params: dict or None, signed) -> str:
+        params = dict(params or {})
+        if not signed:
+            return urlencode(params)
+        if self._recv_window is not None:
+            params['recvWindow'] = self._recv_window
+        params['timestamp'] = await self._timestamp(exchange)
+        return self._signer.signed_query(params)
+
+    async def _request(self, http_method, exchange, method_url, params: dict or None = None, signed=True, weight=1):
+        base_url = self._base_url(exchange)
+        session = self._get_session()
+        is_time_synced = False
+        # 429 / 418 重试次数 与 -1021 重试 分别计数
+        n = 0
+        while True:
+            wait = self._rate_limiter.reserve(base_url, weight=weight)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            url = base_url + method_url
+            query_string = await self._query_string(exchange, params, signed)
+            if query_string:
+                url += '?' + query_string
+            async with session.request(http_method, url) as r:
+                status = r.status
+                headers = r.headers
+                try:
+                    data = await r.json(content_type=None)
+                except ValueError:
+                    data = None
+            self._rate_limiter.update(base_url, headers)
+            if status == 200:
+                return data
+
+            # 429: 超出限频; 418: IP 被封禁
+            if status in [418, 429] and n < self._max_limit_retries:
+                retry_after = parse_retry_after(headers, default=2 ** n)
+                if retry_after <= self._max_retry_after:
+                    self.logger.warning(f'{status} rate limited, {base_url}, retry after {retry_after}s ({n + 1})')
+                    self._rate_limiter.block(base_url, retry_after)
+                    n += 1
+                    continue
+            # -1021: timestamp 超出 recvWindow, 重新同步服务器时间后 重试一次
+            if signed and (data or {}).get('code') == -1021 and not is_time_synced:
+                self.logger.warning(f'{base_url} timestamp rejected, resync server time')
+                await self.sync_time(exchange)
+                is_time_synced = True
+                continue
+            raise BinanceException(status_code=status, data=data)
+
+    async def _post_setting(self, exchange, method_url, params: dict) -> dict or None:
+        """
+        :return: None 代表无需修改
+        """
+        try:
+            return await self._request('POST', exchange, method_url, params)
+        except BinanceException as e:
+            if BinanceClient._is_no_need_to_change(e):
+                return None
+            raise
+
+    async def set_position_mode(self, exchange, use_hedge_mode: bool = False) -> dict or None:
+        return await self._post_setting(exchange, '/v1/positionSide/dual', {
+            'dualSidePosition': 'true' if use_hedge_mode else 'false',
+        })
+
+    async def set_margin_mode(self, exchange, symbol, margin_type='CROSSED') -> dict or None:
+        assert margin_type.upper() in self.MARGIN_TYPE_OPTIONS
+        return await self._post_setting(exchange, '/v1/marginType', {
+            'symbol': symbol,
+            'marginType': margin_type.upper(),
+        })
+
+    async def set_leverage(self, exchange, symbol, leverage=5) -> dict or None:
+        return await self._post_setting(exchange, '/v1/leverage', {
+            'symbol': symbol,
+            'leverage': int(leverage),
+        })
+
+    async def get_server_time(self, exchange) -> int:
+        data = await self._request('GET', exchange, '/v1/time', signed=False, weight=1)
+        return int(data['serverTime'])
+
+    async def get_position_mode(self, exchange) -> bool:
+        data = await self._request('GET', exchange, '/v1/positionSide/dual', weight=30)
+        return bool(data['dualSidePosition'])
+
+    async def get_position_risk(self, exchange) -> list:
+        method_url, weight = self.POSITION_RISK_URL.get(exchange, self.POSITION_RISK_URL['USDM'])
+        return await self._request('GET', exchange, method_url, weight=weight)
+
+    async def get_exchange_info(self, exchange) -> dict:
+        return await self._request('GET', exchange, '/v1/exchangeInfo', signed=False, weight=1)
+
+    async def get_leverage_brackets(self, exchange) -> list:
+        method_url, weight = self.LEVERAGE_BRACKET_URL.get(exchange, self.LEVERAGE_BRACKET_URL['USDM'])
+        return await self._request('GET', exchange, method_url, weight=weight)
+
+    async def apply_symbol_change(self, exchange, change: SymbolChange):
+        # 同一 symbol 必须先修改 margin mode, 再修改 leverage
+        if change.margin_type is not None:
+            await self.set_margin_mode(exchange, symbol=change.symbol, margin_type=change.margin_type)
+        if change.leverage is not None:
+            await self.set_leverage(exchange, symbol=change.symbol, leverage=change.leverage)
+
+
+async def apply_symbol_changes(
+        client: AsyncBinanceClient, exchange, changes: List[SymbolChange], concurrency=10
+) -> Dict[str, Exception]:
+    """
+    并发修改多个 symbol, 同时进行的请求不超过 concurrency
+    :return: { symbol: Exception } 修改失败的 symbol
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _apply(change: SymbolChange):
+        async with semaphore:
+            await client.apply_symbol_change(exchange, change)
+
+    results = await asyncio.gather(*[_apply(change) for change in changes], return_exceptions=True)
+    return {
+        change.symbol: result
+        for change, result in zip(changes, results)
+        if isinstance(result, Exception)
+    }
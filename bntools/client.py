@@ -0,0 +1,250 @@
+"""
+Binance 合约 REST 客户端
+
+    每个 base url (USDM / CoinM) 复用一个 requests.Session, 保持连接池 (keep-alive),
+    避免每次请求都重新建立 TCP + TLS 连接
+"""
+
+import threading
+import logging
+from urllib.parse import urlencode
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .common import BINANCE_BASE_URL
+from .ratelimit import RateLimiter, parse_retry_after
+from .timesync import TimeSync
+from .signer import HmacSigner
+
+
+class BinanceException(Exception):
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        if data:
+            self.code = data.get('code')
+            self.msg = data.get('msg')
+        else:
+            self.code = None
+            self.msg = None
+        message = f"{status_code} [{self.code}] {self.msg}"
+        super().__init__(message)
+
+
+class BinanceClient:
+    """
+    U本位 / 币本位 合约 客户端
+        exchange: BINANCE_BASE_URL 中的 key, 'USDM' / 'CoinM'
+    """
+    MARGIN_TYPE_OPTIONS = ['CROSSED', 'ISOLATED']
+    # { exchange: (method_url, weight) }, 两个市场的 positionRisk 版本不同
+    POSITION_RISK_URL = {
+        'USDM': ('/v2/positionRisk', 5),
+        'CoinM': ('/v1/positionRisk', 1),
+    }
+    LEVERAGE_BRACKET_URL = {
+        'USDM': ('/v1/leverageBracket', 1),
+        'CoinM': ('/v2/leverageBracket', 1),
+    }
+
+    def __init__(
+            self,
+            api_key, secret_key,
+            base_urls: Dict[str, str] or None = None,
+            pool_size=10,
+            max_retries=3,
+            timeout=10,
+            rate_limiter: RateLimiter or None = None,
+            max_limit_retries=5,
+            max_retry_after=300,
+            recv_window: int or None = 5000,
+            time_sync_interval=60 * 5,
+            logger: logging.Logger or None = None,
+    ):
+        """
+        :param base_urls: 默认为 BINANCE_BASE_URL
+        :param pool_size: 每个 base url 连接池 的 最大连接数
+        :param max_retries: 连接失败时的重试次数 (只重试 建立连接 阶段, 请求已发出的不重试)
+        :param timeout: 单次请求超时 (s)
+        :param rate_limiter: 可在多个 client 间共享; 默认每个 client 单独一个
+        :param max_limit_retries: 429 / 418 后 等待 Retry-After 再重试 的最大次数
+        :param max_retry_after: Retry-After 超过此值 (s) 时不再等待, 直接抛出异常
+        :param recv_window: 签名请求的 recvWindow (ms), None 时使用服务器默认值
+        :param time_sync_interval: 后台同步服务器时间的间隔 (s), <= 0 时只在首次请求时同步
+        """
+        self._api_key = api_key
+        self._signer = HmacSigner(secret_key)
+        self._base_urls = dict(BINANCE_BASE_URL if base_urls is None else base_urls)
+        self._pool_size = pool_size
+        self._max_retries = max_retries
+        self._timeout = timeout
+        self._rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        self._max_limit_retries = max_limit_retries
+        self._max_retry_after = max_retry_after
+        self._recv_window = recv_window
+        if isinstance(logger, logging.Logger):
+            self.logger = logger
+        else:
+            self.logger = logging.Logger(name='BinanceClient')
+        self._time_sync = TimeSync(self.get_server_time, refresh_interval=time_sync_interval, logger=self.logger)
+
+        # { base_url: requests.Session }
+        self._sessions: Dict[str, requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+
+    @property
+    def api_key(self) -> str:
+        return self._api_key
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._time_sync.stop()
+        with self._sessions_lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def _new_session(self) -> requests.Session:
+        retry = Retry(
+            total=self._max_retries,
+            connect=self._max_retries,
+            read=0,
+            status=0,
+            backoff_factor=0.2,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'X-MBX-APIKEY': self._api_key})
+        return session
+
+    def _get_session(self, base_url) -> requests.Session:
+        session = self._sessions.get(base_url)
+        if session is None:
+            with self._sessions_lock:
+                session = self._sessions.get(base_url)
+                if session is None:
+                    session = self._new_session()
+                    self._sessions[base_url] = session
+        return session
+
+    def _base_url(self, exchange) -> str:
+        try:
+            return self._base_urls[exchange]
+        except KeyError:
+            raise ValueError(f'unknown exchange: {exchange}, options: {list(self._base_urls.keys())}')
+
+    def _query_string(self, exchange, params: dict or None, signed) -> str:
+        params = dict(params or {})
+        if not signed:
+            return urlencode(params)
+        if self._recv_window is not None:
+            params['recvWindow'] = self._recv_window
+        params['timestamp'] = self._time_sync.timestamp(exchange)
+        return self._signer.signed_query(params)
+
+    def _request(self, http_method, exchange, method_url, params: dict or None = None, signed=True, weight=1):
+        base_url = self._base_url(exchange)
+        session = self._get_session(base_url)
+        is_time_synced = False
+        # 429 / 418 重试次数 与 -1021 重试 分别计数
+        n = 0
+        while True:
+            self._rate_limiter.acquire(base_url, weight=weight)
+            url = base_url + method_url
+            query_string = self._query_string(exchange, params, signed)
+            if query_string:
+                url += '?' + query_string
+            r = session.request(http_method, url, timeout=self._timeout)
+            self._rate_limiter.update(base_url, r.headers)
+            try:
+                data = r.json()
+            except ValueError:
+                data = None
+            if r.status_code == 200:
+                return data
+
+            # 429: 超出限频; 418: IP 被封禁
+            if r.status_code in [418, 429] and n < self._max_limit_retries:
+                retry_after = parse_retry_after(r.headers, default=2 ** n)
+                if retry_after <= self._max_retry_after:
+                    self.logger.warning(
+                        f'{r.status_code} rate limited, {base_url}, retry after {retry_after}s ({n + 1})')
+                    self._rate_limiter.block(base_url, retry_after)
+                    n += 1
+                    continue
+            # -1021: timestamp 超出 recvWindow, 重新同步服务器时间后 重试一次
+            if signed and (data or {}).get('code') == -1021 and not is_time_synced:
+                self.logger.warning(f'{base_url} timestamp rejected, resync server time')
+                self._time_sync.sync(exchange)
+                is_time_synced = True
+                continue
+            raise BinanceException(status_code=r.status_code, data=data)
+
+    @staticmethod
+    def _is_no_need_to_change(e: BinanceException) -> bool:
+        return bool(e.msg) and ('no need to change' in e.msg.lower())
+
+    def _post_setting(self, exchange, method_url, params: dict) -> dict or None:
+        """
+        :return: None 代表无需修改
+        """
+        try:
+            return self._request('POST', exchange, method_url, params)
+        except BinanceException as e:
+            if self._is_no_need_to_change(e):
+                return None
+            raise
+
+    def set_position_mode(self, exchange, use_hedge_mode: bool = False) -> dict or None:
+        return self._post_setting(exchange, '/v1/positionSide/dual', {
+            'dualSidePosition': 'true' if use_hedge_mode else 'false',
+        })
+
+    def set_margin_mode(self, exchange, symbol, margin_type='CROSSED') -> dict or None:
+        assert margin_type.upper() in self.MARGIN_TYPE_OPTIONS
+        return self._post_setting(exchange, '/v1/marginType', {
+            'symbol': symbol,
+            'marginType': margin_type.upper(),
+        })
+
+    def set_leverage(self, exchange, symbol, leverage=5) -> dict or None:
+        return self._post_setting(exchange, '/v1/leverage', {
+            'symbol': symbol,
+            'leverage': int(leverage),
+        })
+
+    def get_server_time(self, exchange) -> int:
+        return int(self._request('GET', exchange, '/v1/time', signed=False, weight=1)['serverTime'])
+
+    def get_position_mode(self, exchange) -> bool:
+        """
+        :return: True: 双向持仓 (Hedge); False: 单向持仓 (One-way)
+        """
+        data = self._request('GET', exchange, '/v1/positionSide/dual', weight=30)
+        return bool(data['dualSidePosition'])
+
+    def get_position_risk(self, exchange) -> list:
+        """
+        所有 symbol 的 持仓风险, 包含 leverage / marginType
+        """
+        method_url, weight = self.POSITION_RISK_URL.get(exchange, self.POSITION_RISK_URL['USDM'])
+        return self._request('GET', exchange, method_url, weight=weight)
+
+    def get_exchange_info(self, exchange) -> dict:
+        return self._request('GET', exchange, '/v1/exchangeInfo', signed=False, weight=1)
+
+    def get_leverage_brackets(self, exchange) -> list:
+        """
+        [{'symbol': , 'brackets': [{'bracket': 1, 'initialLeverage': 125, ...}, ]}, ]
+        """
+        method_url, weight = self.LEVERAGE_BRACKET_URL.get(exchange, self.LEVERAGE_BRACKET_URL['USDM'])
+        return self._request('GET', exchange, method_url, weight=weight)
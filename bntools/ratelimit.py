@@ -0,0 +1,116 @@
+"""
+Binance 请求限频 (客户端)
+
+    按 base url 分别维护 token bucket (USDM / CoinM 的额度相互独立),
+    请求前预先扣除 weight, 额度不足时等待; 收到响应后用 X-MBX-USED-WEIGHT-1M 等 header 校正
+"""
+
+import time
+import threading
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+
+HEADER_USED_WEIGHT = 'X-MBX-USED-WEIGHT-1M'
+HEADER_ORDER_COUNT = 'X-MBX-ORDER-COUNT-1M'
+
+# 每分钟额度, 与 exchangeInfo rateLimits 一致
+DEFAULT_LIMITS = {
+    HEADER_USED_WEIGHT: 2400,
+    HEADER_ORDER_COUNT: 1200,
+}
+
+
+@dataclass
+class _Bucket:
+    capacity: float
+    tokens: float
+    rate: float         # 每秒恢复的 token
+    updated: float      # time.monotonic()
+
+
+class RateLimiter:
+    """
+    线程安全, 可被多个 BinanceClient 共享
+        reserve() 只计算需要等待的时间, 不阻塞 (异步客户端可自行 await)
+        acquire() 阻塞等待
+    """
+    def __init__(self, limits: Dict[str, int] or None = None, interval=60, safety_ratio=0.9):
+        """
+        :param limits: { header: 每个 interval 的额度 }
+        :param safety_ratio: 只使用额度的一部分, 为其他进程 / 统计误差留余量
+        """
+        self._limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self._interval = interval
+        self._safety_ratio = safety_ratio
+        # { (base_url, header): _Bucket }
+        self._buckets: Dict[Tuple[str, str], _Bucket] = {}
+        # { base_url: monotonic, 429 / 418 后的 禁止请求时间 }
+        self._blocked_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _get_bucket(self, base_url, header, now) -> _Bucket:
+        bucket = self._buckets.get((base_url, header))
+        if bucket is None:
+            capacity = self._limits[header] * self._safety_ratio
+            bucket = _Bucket(capacity=capacity, tokens=capacity, rate=capacity / self._interval, updated=now)
+            self._buckets[(base_url, header)] = bucket
+        else:
+            bucket.tokens = min(bucket.capacity, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+        return bucket
+
+    def reserve(self, base_url, weight=1, orders=0) -> float:
+        """
+        预先扣除额度
+        :return: 需要等待的秒数
+        """
+        now = time.monotonic()
+        wait = 0.
+        with self._lock:
+            for header, cost in [(HEADER_USED_WEIGHT, weight), (HEADER_ORDER_COUNT, orders)]:
+                if not cost or header not in self._limits:
+                    continue
+                bucket = self._get_bucket(base_url, header, now)
+                bucket.tokens -= cost
+                if bucket.tokens < 0:
+                    wait = max(wait, -bucket.tokens / bucket.rate)
+            wait = max(wait, self._blocked_until.get(base_url, 0) - now)
+        return wait
+
+    def acquire(self, base_url, weight=1, orders=0):
+        wait = self.reserve(base_url, weight=weight, orders=orders)
+        if wait > 0:
+            time.sleep(wait)
+
+    def update(self, base_url, headers):
+        """
+        使用响应 header 中 服务器统计的已用额度 校正本地 bucket
+        """
+        now = time.monotonic()
+        with self._lock:
+            for header in self._limits:
+                used = headers.get(header)
+                if used is None:
+                    continue
+                try:
+                    used = float(used)
+                except ValueError:
+                    continue
+                bucket = self._get_bucket(base_url, header, now)
+                bucket.tokens = min(bucket.tokens, bucket.capacity - used)
+
+    def block(self, base_url, seconds):
+        """
+        429 / 418 后, 在 seconds 内 暂停该 base url 的所有请求
+        """
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._blocked_until[base_url] = max(self._blocked_until.get(base_url, 0), until)
+
+
+def parse_retry_after(headers, default) -> float:
+    try:
+        return max(0., float(headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return default
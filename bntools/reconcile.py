@@ -0,0 +1,75 @@
+"""
+先读后写:
+    一次性获取账户当前的 position mode / margin type / leverage, 与目标配置比较,
+    只对需要修改的部分发送请求
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List
+
+from .client import BinanceClient
+
+
+@dataclass
+class SymbolState:
+    margin_type: str    # 'CROSSED' / 'ISOLATED'
+    leverage: int
+
+
+@dataclass
+class SymbolChange:
+    """
+    margin_type / leverage 为 None 代表无需修改
+    """
+    symbol: str
+    margin_type: str or None = None
+    leverage: int or None = None
+
+    @property
+    def is_empty(self) -> bool:
+        return (self.margin_type is None) and (self.leverage is None)
+
+
+def normalize_margin_type(margin_type: str) -> str:
+    """
+    positionRisk 返回 'cross' / 'isolated', 修改接口使用 'CROSSED' / 'ISOLATED'
+    """
+    margin_type = margin_type.upper()
+    if margin_type == 'CROSS':
+        return 'CROSSED'
+    return margin_type
+
+
+def fetch_symbols_state(client: BinanceClient, exchange) -> Dict[str, SymbolState]:
+    d_state = {}
+    for position in client.get_position_risk(exchange):
+        # 双向持仓时 同一 symbol 有 LONG / SHORT 多条, 设置相同
+        d_state[position['symbol']] = SymbolState(
+            margin_type=normalize_margin_type(position['marginType']),
+            leverage=int(position['leverage']),
+        )
+    return d_state
+
+
+def diff_symbols(
+        d_state: Dict[str, SymbolState], symbols: list, margin_type, leverage
+) -> List[SymbolChange]:
+    """
+    :return: 需要修改的 symbol; 账户中查不到的 symbol 视为全部需要修改
+    """
+    margin_type = normalize_margin_type(margin_type)
+    leverage = int(leverage)
+    l_change = []
+    for symbol in symbols:
+        state = d_state.get(symbol)
+        if state is None:
+            l_change.append(SymbolChange(symbol=symbol, margin_type=margin_type, leverage=leverage))
+            continue
+        change = SymbolChange(
+            symbol=symbol,
+            margin_type=None if state.margin_type == margin_type else margin_type,
+            leverage=None if state.leverage == leverage else leverage,
+        )
+        if not change.is_empty:
+            l_change.append(change)
+    return l_change
@@ -0,0 +1,26 @@
+"""
+HMAC SHA256 签名
+
+    secret 只编码 / 初始化一次, 每次签名复制已初始化的 hmac 状态
+"""
+
+import hmac
+import hashlib
+from urllib.parse import urlencode
+
+
+class HmacSigner:
+    def __init__(self, secret_key: str):
+        self._hmac = hmac.new(secret_key.encode('utf-8'), digestmod=hashlib.sha256)
+
+    def sign(self, query_string: str) -> str:
+        h = self._hmac.copy()
+        h.update(query_string.encode('utf-8'))
+        return h.hexdigest()
+
+    def signed_query(self, params: dict) -> str:
+        """
+        :return: 含 signature 的 完整 query string
+        """
+        query_string = urlencode(params)
+        return f'{query_string}&signature={self.sign(query_string)}'
@@ -0,0 +1,180 @@
+"""
+合约 symbol 索引
+
+    每个市场 (USDM / CoinM) 只下载一次 exchangeInfo 和 leverageBracket, 保存到本地缓存 (带有效期),
+    建立 统一名称 (ccxt 格式, 如 BTC/USDT:USDT, BTC/USD:BTC) -> 交易所 symbol 的索引,
+    在发送修改请求前 本地完成 symbol 的 转换 和 校验
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from .client import BinanceClient
+
+
+PATH_DEFAULT_CACHE_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache')
+
+# exchangeInfo 中需要保留的字段
+SYMBOL_INFO_FIELDS = [
+    'symbol', 'pair', 'contractType', 'deliveryDate',
+    'baseAsset', 'quoteAsset', 'marginAsset', 'status', 'contractStatus',
+]
+
+
+def to_unified_symbol(symbol_info: dict) -> str:
+    """
+    永续: BTC/USDT:USDT, BTC/USD:BTC
+    交割: BTC/USDT:USDT-231229, BTC/USD:BTC-231229
+    """
+    s = f"{symbol_info['baseAsset']}/{symbol_info['quoteAsset']}:{symbol_info['marginAsset']}"
+    if symbol_info.get('contractType', 'PERPETUAL') not in ['PERPETUAL', '']:
+        dt_delivery = datetime.fromtimestamp(int(symbol_info['deliveryDate']) / 1000, tz=timezone.utc)
+        s += '-' + dt_delivery.strftime('%y%m%d')
+    return s
+
+
+class SymbolRegistry:
+    def __init__(
+            self,
+            client: BinanceClient,
+            cache_root=None,
+            ttl=60 * 60 * 12,
+            logger: logging.Logger or None = None,
+    ):
+        """
+        :param cache_root: 缓存文件夹, 默认为 项目根目录下的 cache
+        :param ttl: 缓存有效期 (s)
+        """
+        self._client = client
+        self._cache_root = os.path.abspath(cache_root or PATH_DEFAULT_CACHE_ROOT)
+        self._ttl = ttl
+        if isinstance(logger, logging.Logger):
+            self.logger = logger
+        else:
+            self.logger = logging.Logger(name='SymbolRegistry')
+
+        # { exchange: { unified / symbol: symbol } }
+        self._index: Dict[str, Dict[str, str]] = {}
+        # { exchange: { symbol: symbol_info } }
+        self._symbols: Dict[str, Dict[str, dict]] = {}
+        # { exchange: { symbol: max leverage } }
+        self._max_leverage: Dict[str, Dict[str, int]] = {}
+
+    def _read_cache(self, file_name):
+        path_file = os.path.join(self._cache_root, file_name)
+        if not os.path.isfile(path_file):
+            return None
+        try:
+            with open(path_file, encoding='utf-8') as f:
+                d_cache = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f'读取缓存失败 {path_file}: {e}')
+            return None
+        if time.time() - d_cache.get('updated', 0) > self._ttl:
+            return None
+        return d_cache['data']
+
+    def _write_cache(self, file_name, data):
+        os.makedirs(self._cache_root, exist_ok=True)
+        path_file = os.path.join(self._cache_root, file_name)
+        # 多个账户 / 进程 可能同时写入, 先写到各自的临时文件 再替换
+        fd, path_tmp = tempfile.mkstemp(dir=self._cache_root, prefix=file_name, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'updated': time.time(), 'data': data}, f)
+        os.replace(path_tmp, path_file)
+
+    def _load_symbols(self, exchange, force) -> List[dict]:
+        file_name = f'exchange_info_{exchange}.json'
+        l_symbol_info = None if force else self._read_cache(file_name)
+        if l_symbol_info is None:
+            self.logger.info(f'download exchangeInfo, {exchange}')
+            l_symbol_info = [
+                {k: v for k, v in symbol_info.items() if k in SYMBOL_INFO_FIELDS}
+                for symbol_info in self._client.get_exchange_info(exchange)['symbols']
+            ]
+            self._write_cache(file_name, l_symbol_info)
+        return l_symbol_info
+
+    def _load_brackets(self, exchange, force) -> list:
+        # 杠杆分层 与账户相关, 缓存文件按 api key 区分
+        account_tag = hashlib.sha1(self._client.api_key.encode('utf-8')).hexdigest()[:8]
+        file_name = f'leverage_bracket_{exchange}_{account_tag}.json'
+        l_bracket = None if force else self._read_cache(file_name)
+        if l_bracket is None:
+            self.logger.info(f'download leverageBracket, {exchange}')
+            l_bracket = self._client.get_leverage_brackets(exchange)
+            self._write_cache(file_name, l_bracket)
+        return l_bracket
+
+    def load(self, exchange, force=False, with_brackets=True):
+        d_symbols = {}
+        d_index = {}
+        for symbol_info in self._load_symbols(exchange, force=force):
+            symbol = symbol_info['symbol']
+            d_symbols[symbol] = symbol_info
+            d_index[symbol] = symbol
+            d_index[to_unified_symbol(symbol_info)] = symbol
+        self._symbols[exchange] = d_symbols
+        self._index[exchange] = d_index
+
+        if with_brackets:
+            self._max_leverage[exchange] = {
+                item['symbol']: max(int(bracket['initialLeverage']) for bracket in item['brackets'])
+                for item in self._load_brackets(exchange, force=force)
+                if item.get('brackets')
+            }
+
+    def _ensure_loaded(self, exchange):
+        if exchange not in self._index:
+            self.load(exchange)
+
+    def to_exchange_symbol(self, exchange, symbol) -> str or None:
+        """
+        :param symbol: 统一名称 或 交易所 symbol
+        :return: None 代表不存在
+        """
+        self._ensure_loaded(exchange)
+        d_index = self._index[exchange]
+        return d_index.get(symbol) or d_index.get(symbol.upper())
+
+    def max_leverage(self, exchange, symbol) -> int or None:
+        self._ensure_loaded(exchange)
+        exchange_symbol = self.to_exchange_symbol(exchange, symbol)
+        return self._max_leverage.get(exchange, {}).get(exchange_symbol)
+
+    def is_trading(self, exchange, symbol) -> bool:
+        exchange_symbol = self.to_exchange_symbol(exchange, symbol)
+        if exchange_symbol is None:
+            return False
+        symbol_info = self._symbols[exchange][exchange_symbol]
+        # USDM 为 status, CoinM 为 contractStatus
+        return (symbol_info.get('status') or symbol_info.get('contractStatus')) == 'TRADING'
+
+    def normalize(self, exchange, symbols: list, leverage=None) -> Tuple[List[str], List[str]]:
+        """
+        转换为 交易所 symbol 并校验
+        :return: (交易所 symbol, 错误信息)
+        """
+        l_symbol = []
+        l_error = []
+        for symbol in symbols:
+            exchange_symbol = self.to_exchange_symbol(exchange, symbol)
+            if exchange_symbol is None:
+                l_error.append(f'{exchange} {symbol}: symbol 不存在')
+                continue
+            if not self.is_trading(exchange, exchange_symbol):
+                l_error.append(f'{exchange} {symbol}: 非交易状态')
+                continue
+            if leverage is not None:
+                max_leverage = self.max_leverage(exchange, exchange_symbol)
+                if (max_leverage is not None) and (int(leverage) > max_leverage):
+                    l_error.append(f'{exchange} {symbol}: leverage {leverage} 超过最大值 {max_leverage}')
+                    continue
+            l_symbol.append(exchange_symbol)
+        return l_symbol, l_error
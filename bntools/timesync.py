@@ -0,0 +1,87 @@
+"""
+服务器时间 同步
+
+    本地时钟与服务器有偏差时, 签名请求会被 -1021 拒绝,
+    定期测量 本地 与 /v1/time 的 偏差, 生成签名用的 timestamp 时加上偏差
+"""
+
+import time
+import threading
+import logging
+from typing import Callable, Dict
+
+
+class TimeSync:
+    def __init__(
+            self,
+            fetch_server_time: Callable[[str], int],
+            refresh_interval=60 * 5,
+            logger: logging.Logger or None = None,
+    ):
+        """
+        :param fetch_server_time: fetch_server_time(exchange) -> 服务器时间 (ms)
+        :param refresh_interval: 后台刷新间隔 (s), <= 0 时不启动后台刷新
+        """
+        self._fetch_server_time = fetch_server_time
+        self._refresh_interval = refresh_interval
+        if isinstance(logger, logging.Logger):
+            self.logger = logger
+        else:
+            self.logger = logging.Logger(name='TimeSync')
+
+        # { exchange: offset ms, 服务器时间 - 本地时间 }
+        self._offset: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # 首次同步, 避免并发请求 同时同步
+        self._first_sync_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread or None = None
+
+    def sync(self, exchange) -> float:
+        """
+        使用 请求往返的中点 估计 本地时间
+        :return: offset (ms)
+        """
+        t_send = time.time()
+        server_time = self._fetch_server_time(exchange)
+        t_recv = time.time()
+        offset = server_time - (t_send + t_recv) / 2 * 1000
+        with self._lock:
+            self._offset[exchange] = offset
+        self.logger.info(f'time sync, {exchange}, offset {offset:.0f}ms, rtt {(t_recv - t_send) * 1000:.0f}ms')
+        return offset
+
+    def timestamp(self, exchange) -> int:
+        offset = self._offset.get(exchange)
+        if offset is None:
+            with self._first_sync_lock:
+                offset = self._offset.get(exchange)
+                if offset is None:
+                    offset = self.sync(exchange)
+            self._start_refresh()
+        return int(time.time() * 1000 + offset)
+
+    def _start_refresh(self):
+        if self._refresh_interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._refresh_loop, name='TimeSync', daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self._refresh_interval):
+            for exchange in list(self._offset.keys()):
+                try:
+                    self.sync(exchange)
+                except Exception as e:
+                    self.logger.warning(f'time sync fail, {exchange}: {e}')
+
+    def stop(self):
+        self._stop_event.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
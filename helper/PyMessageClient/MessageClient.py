@@ -1,14 +1,29 @@
 from datetime import datetime
 import os
-import subprocess
-from enum import Enum
-from dataclasses import dataclass
+import tempfile
+from typing import Dict, List
 
 import logging
 try:
     from .simpleLogger import MyLogger
+    from .constant import RunException, MCTask, MessageClientRtnData
+    from .transport import format_exe_cmd, write_file_atomic
+    from .engine import MessageEngine, RetryPolicy
+    from .transport import DEFAULT_BATCH_CONCURRENCY
+    from .delta import (
+        DeltaState, DeltaError, make_delta, apply_delta, pack_envelope, unpack_envelope, sha256_digest,
+        MODE_FULL, MODE_DELTA, BASE_KEY_PREFIX,
+    )
 except:
     from simpleLogger import MyLogger
+    from constant import RunException, MCTask, MessageClientRtnData
+    from transport import format_exe_cmd, write_file_atomic
+    from engine import MessageEngine, RetryPolicy
+    from transport import DEFAULT_BATCH_CONCURRENCY
+    from delta import (
+        DeltaState, DeltaError, make_delta, apply_delta, pack_envelope, unpack_envelope, sha256_digest,
+        MODE_FULL, MODE_DELTA, BASE_KEY_PREFIX,
+    )
 
 
 PATH_ROOT = os.path.abspath(os.path.dirname(__file__))
@@ -17,35 +32,25 @@ PATH_MC_EXE = os.path.join(PATH_MC, 'TradingPlatform.MessageClient.exe')
 assert os.path.isfile(PATH_MC_EXE)
 
 
-class RunException(Enum):
-    """
-    """
-    TimeOut = 0
-    Error = -1
-
-
-class MCTask(Enum):
-    SendFile = 'sendfile'
-    SendMessage = 'sendmessage'
-    GetFile = 'getfile'
-    GetMessage = 'getmessage'
-    Status = 'status'
-    Clear = 'clear'
-
-
-@dataclass
-class MessageClientRtnData:
-    datetime: datetime
-    exception: RunException or None
-    msg: str = ''
-
-
 class MessageClient:
+    TRANSPORT_OPTIONS = MessageEngine.TRANSPORT_OPTIONS
+    # 大文件: sendfile_stream / getfile_stream 按 文件大小 / EXE_MIN_RATE 增加超时 (bytes/s)
+    EXE_MIN_RATE = 1024 * 1024
+
     def __init__(
             self,
             ip, port,
             logger: logging.Logger or None = None,
+            transport: str = 'exe',
+            retry_policy: RetryPolicy or None = None,
+            max_concurrency=DEFAULT_BATCH_CONCURRENCY,
     ):
+        """
+        :param logger: 默认为 同步输出的 MyLogger; 需要 不阻塞的日志时 传入 MyLogger(use_queue=True)
+        :param transport: 'exe': 每次调用启动 TradingPlatform.MessageClient.exe (目前唯一的方式)
+        :param retry_policy: 重试间隔 (指数退避 + 抖动), 见 engine.py
+        :param max_concurrency: send_many / get_many / getfile_many 同时运行的 进程数
+        """
         self._ip = ip
         self._port = port
         self._message_client = PATH_MC
@@ -54,6 +59,20 @@ class MessageClient:
             self.logger = logger
         else:
             self.logger = MyLogger(name='MessageClient')
+        self._engine = MessageEngine(
+            ip=ip, port=port, cwd=self._message_client, logger=self.logger,
+            transport=transport, retry_policy=retry_policy, max_concurrency=max_concurrency,
+        )
+
+    def close(self):
+        self._engine.close()
+
+    @property
+    def stats(self) -> dict:
+        """
+        (ip, port) 的 调用 / 重试 / 超时 / 熔断 次数 与 延迟, 进程内所有 client 共用
+        """
+        return self._engine.endpoint.stats.snapshot()
 
     @staticmethod
     def _check_timeout_arg(timeout, default=5) -> float:
@@ -79,65 +98,24 @@ class MessageClient:
         finally:
             return max_try
 
-    def _run_tp_mc(self, s_cmd, timeout) -> MessageClientRtnData:
-        p = subprocess.Popen(
-            s_cmd,
-            cwd=self._message_client,
-            stdout=subprocess.PIPE,
-            shell=True,
-        )
-
-        try:
-            outs, errs = p.communicate(timeout=timeout)
-            output_s = str(outs, encoding="utf-8")
-        except subprocess.TimeoutExpired as e:
-            p.kill()
-            self.logger.error('调用 MessageClient 超时:')
-            self.logger.error(e)
-            return MessageClientRtnData(datetime=datetime.now(), exception=RunException.TimeOut, msg=str(e))
-        except Exception as e:
-            p.kill()
-            self.logger.error('调用 MessageClient 失败:')
-            self.logger.error(e)
-            return MessageClientRtnData(datetime=datetime.now(), exception=RunException.Error, msg=str(e))
-        else:
-            if 'Exception' in output_s:
-                p.kill()
-                self.logger.warning('调用 MessageClient 失败:')
-                self.logger.warning(output_s)
-                return MessageClientRtnData(datetime=datetime.now(), exception=RunException.Timeout, msg=output_s)
-            else:
-                p.kill()
-                # print(output_s)
-                return MessageClientRtnData(
-                    # datetime=datetime.now(), exception=None, msg=output_s.split('\n')[1].split('<<')[1].strip())
-                    datetime=datetime.now(), exception=None, msg=output_s.split('<<')[-1].strip())
-
-    def _run(self, cmd, timeout=5, max_try=5) -> MessageClientRtnData:
+    def _run(self, task: MCTask, args: list, timeout=5, max_try=5) -> MessageClientRtnData:
         timeout = self._check_timeout_arg(timeout, default=5)
         max_try = self._check_maxtry_arg(max_try, default=5)
+        return self._engine.run(task, args, timeout=timeout, max_try=max_try)
 
-        s_cmd = f'TradingPlatform.MessageClient.exe {self._ip} {self._port} {cmd}'
-        for n in range(max_try):
-            rtn_data: MessageClientRtnData = self._run_tp_mc(s_cmd=s_cmd, timeout=timeout)
-            error_type: RunException or None = rtn_data.exception
-            if not error_type:
-                # print(rtn_data.msg)
-                return rtn_data
-            else:
-                if error_type == RunException.TimeOut:
-                    self.logger.error(f'第{n+1}次运行，超时')
-                    continue
-                if error_type == RunException.Error:
-                    self.logger.error(f'第{n + 1}次运行，失败')
-                    continue
-        self.logger.error('超过最大运行次数')
-        return MessageClientRtnData(datetime=datetime.now(), exception=RunException.Error, msg='')
+    def _run_many(self, items: List[tuple], timeout=5, max_try=5) -> List[MessageClientRtnData]:
+        """
+        批量运行, 每次重试只重新发送失败的部分
+        :param items: [(task, args, after), ], after: 依赖的 item 下标, 该 item 成功后才运行
+        """
+        timeout = self._check_timeout_arg(timeout, default=5)
+        max_try = self._check_maxtry_arg(max_try, default=5)
+        return self._engine.run_many(items, timeout=timeout, max_try=max_try)
 
     def sendfile(self, key, file_path, timeout=5, max_try=5, with_timestamp: bool = False) -> MessageClientRtnData:
-        s_cmd = f'{MCTask.SendFile.value} "{key}" "{file_path}"'
-        self.logger.info(s_cmd)
-        mcr: MessageClientRtnData = self._run(cmd=s_cmd, timeout=timeout, max_try=max_try)
+        args = [key, file_path]
+        self.logger.info(format_exe_cmd(MCTask.SendFile, args))
+        mcr: MessageClientRtnData = self._run(MCTask.SendFile, args, timeout=timeout, max_try=max_try)
         if not with_timestamp:
             return mcr
         else:
@@ -151,9 +129,9 @@ class MessageClient:
                 return mcr
 
     def sendmessage(self, key, message, timeout=5, max_try=5, with_timestamp: bool = False) -> MessageClientRtnData:
-        s_cmd = f'{MCTask.SendMessage.value} "{key}" "{message}"'
-        self.logger.info(s_cmd)
-        mcr = self._run(cmd=s_cmd, timeout=timeout, max_try=max_try)
+        args = [key, message]
+        self.logger.info(format_exe_cmd(MCTask.SendMessage, args))
+        mcr = self._run(MCTask.SendMessage, args, timeout=timeout, max_try=max_try)
         if not with_timestamp:
             return mcr
         else:
@@ -166,9 +144,147 @@ class MessageClient:
                     self.logger.error('send dt key fail')
                 return mcr
 
+    def _send_timestamp(self, key):
+        mcr_dt = self.sendmessage(key='dt#' + key, message=datetime.now().strftime('%Y%m%d %H%M%S'))
+        if mcr_dt.exception:
+            self.logger.error('send dt key fail')
+
+    def sendfile_stream(self, key, file_path, timeout=5, max_try=5,
+                        with_timestamp: bool = False) -> MessageClientRtnData:
+        """
+        大文件上传: 超时 按 文件大小 / EXE_MIN_RATE 增加; 仍为 一次 exe 调用, 不能分块 / 续传
+        :param timeout: 基础超时
+        """
+        timeout = self._check_timeout_arg(timeout, default=5) + os.path.getsize(file_path) / self.EXE_MIN_RATE
+        return self.sendfile(key, file_path, timeout=timeout, max_try=max_try, with_timestamp=with_timestamp)
+
+    def getfile_stream(self, key, file_path, timeout=5, max_try=5,
+                       with_timestamp_gap: int or None = None,
+                       expected_size: int or None = None) -> MessageClientRtnData or None:
+        """
+        大文件下载: 超时 按 expected_size / EXE_MIN_RATE 增加; 仍为 一次 exe 调用, 不能分块 / 续传
+        :param timeout: 基础超时
+        :param expected_size: 预计的 文件大小 (bytes); None 时 使用 file_path 已有文件 (上一版本) 的大小
+        """
+        if expected_size is None:
+            expected_size = os.path.getsize(file_path) if os.path.isfile(file_path) else 0
+        timeout = self._check_timeout_arg(timeout, default=5) + expected_size / self.EXE_MIN_RATE
+        return self.getfile(key, file_path, timeout=timeout, max_try=max_try,
+                            with_timestamp_gap=with_timestamp_gap)
+
+    def _send_bytes(self, key, data: bytes, tmp_root, timeout, max_try) -> MessageClientRtnData:
+        fd, path_tmp = tempfile.mkstemp(dir=tmp_root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            return self.sendfile(key, path_tmp, timeout=timeout, max_try=max_try)
+        finally:
+            os.remove(path_tmp)
+
+    def _get_bytes(self, key, tmp_root, timeout, max_try) -> (MessageClientRtnData, bytes or None):
+        fd, path_tmp = tempfile.mkstemp(dir=tmp_root, suffix='.tmp')
+        os.close(fd)
+        try:
+            mcr = self.getfile(key, path_tmp, timeout=timeout, max_try=max_try)
+            if mcr.exception:
+                return mcr, None
+            with open(path_tmp, 'rb') as f:
+                return mcr, f.read()
+        finally:
+            os.remove(path_tmp)
+
+    def sendfile_delta(self, key, file_path, state_root, timeout=5, max_try=5, with_timestamp: bool = False,
+                       rebase_ratio=0.5, max_deltas=50) -> MessageClientRtnData:
+        """
+        只发送 相对上次基准版本的 压缩增量, 见 delta.py
+        :param state_root: 保存 基准版本 的目录, 每个发送方 独立
+        :param rebase_ratio: 增量 超过 完整压缩大小 * rebase_ratio 时 重新发布基准
+        :param max_deltas: 连续发布增量 的最大次数, 之后 重新发布基准
+        """
+        with open(file_path, 'rb') as f:
+            target = f.read()
+        target_digest = sha256_digest(target)
+        state = DeltaState(state_root)
+        base, d_meta = state.load(key)
+        full_envelope = pack_envelope(MODE_FULL, bytes(32), target_digest, target)
+
+        envelope = None
+        rebase = True
+        if (base is not None) and (d_meta.get('deltas', 0) < max_deltas):
+            delta_envelope = pack_envelope(MODE_DELTA, sha256_digest(base), target_digest, make_delta(base, target))
+            if len(delta_envelope) <= len(full_envelope) * rebase_ratio:
+                envelope = delta_envelope
+                rebase = False
+        if rebase:
+            # 没有基准 / 增量过大: 先发布新的基准, key 中为 相对新基准的 (空) 增量
+            self.logger.info(f'sendfile delta, {key}, rebase, {len(full_envelope)} bytes')
+            mcr = self._send_bytes(BASE_KEY_PREFIX + key, full_envelope, state_root, timeout, max_try)
+            if mcr.exception:
+                return mcr
+            state.save(key, target, deltas=0)
+            envelope = pack_envelope(MODE_DELTA, target_digest, target_digest, make_delta(target, target))
+
+        self.logger.info(f'sendfile delta, {key}, {len(envelope)}/{len(target)} bytes')
+        mcr = self._send_bytes(key, envelope, state_root, timeout, max_try)
+        if mcr.exception:
+            return mcr
+        if not rebase:
+            d_meta['deltas'] = d_meta.get('deltas', 0) + 1
+            state.save_meta(key, d_meta)
+        if with_timestamp:
+            self._send_timestamp(key)
+        return mcr
+
+    def getfile_delta(self, key, file_path, state_root, timeout=5, max_try=5,
+                      with_timestamp_gap: int or None = None) -> MessageClientRtnData or None:
+        """
+        获取 sendfile_delta 发布的文件, 本地没有对应的基准版本时 下载基准
+        :param state_root: 保存 基准版本 的目录
+        """
+        file_path = os.path.abspath(file_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if with_timestamp_gap:
+            if not self._get_timestamp(key=key, gap=with_timestamp_gap):
+                return None
+
+        state = DeltaState(state_root)
+        # 发送方 正在重新发布基准时, 信封 与 基准 可能不对应, 重新获取一次
+        for n in range(2):
+            mcr, envelope = self._get_bytes(key, state_root, timeout, max_try)
+            if mcr.exception:
+                return mcr
+            try:
+                mode, base_digest, target_digest, payload = unpack_envelope(envelope)
+                if mode == MODE_FULL:
+                    target = payload
+                else:
+                    base, _ = state.load(key)
+                    if (base is None) or (sha256_digest(base) != base_digest):
+                        self.logger.info(f'getfile delta, {key}, download base')
+                        mcr_base, base_envelope = self._get_bytes(BASE_KEY_PREFIX + key, state_root, timeout, max_try)
+                        if mcr_base.exception:
+                            return mcr_base
+                        base = unpack_envelope(base_envelope)[3]
+                        if sha256_digest(base) != base_digest:
+                            self.logger.warning(f'getfile delta, {key}, base changed')
+                            continue
+                        state.save(key, base)
+                    target = apply_delta(base, payload)
+                if sha256_digest(target) != target_digest:
+                    raise DeltaError('sha256 mismatch')
+            except DeltaError as e:
+                self.logger.error(f'getfile delta error, {key}: {e}')
+                return MessageClientRtnData(datetime=datetime.now(), exception=RunException.Error, msg=str(e))
+            write_file_atomic(file_path, target)
+            return mcr
+        return MessageClientRtnData(datetime=datetime.now(), exception=RunException.Error, msg='base changed')
+
     def _get_timestamp(self, key, gap) -> None or datetime:
         dt_key = 'dt#' + key
         dt_mcr = self.getmessage(key=dt_key)
+        return self._check_timestamp(dt_mcr, gap)
+
+    def _check_timestamp(self, dt_mcr: MessageClientRtnData, gap) -> None or datetime:
         if dt_mcr.exception:
             self.logger.error('get timestamp fail')
             return None
@@ -192,39 +308,99 @@ class MessageClient:
         if not os.path.isdir(os.path.dirname(file_path)):
             os.makedirs(os.path.dirname(file_path))
 
-        s_cmd = f'{MCTask.GetFile.value} "{key}" "{file_path}"'
-        self.logger.info(s_cmd)
+        args = [key, file_path]
+        self.logger.info(format_exe_cmd(MCTask.GetFile, args))
         if not with_timestamp_gap:
-            return self._run(cmd=s_cmd, timeout=timeout, max_try=max_try)
+            return self._run(MCTask.GetFile, args, timeout=timeout, max_try=max_try)
         else:
             key_dt = self._get_timestamp(key=key, gap=with_timestamp_gap)
             if key_dt:
-                return self._run(cmd=s_cmd, timeout=timeout, max_try=max_try)
+                return self._run(MCTask.GetFile, args, timeout=timeout, max_try=max_try)
             else:
                 return None
 
     def getmessage(self, key, timeout=5, max_try=5,
                    with_timestamp_gap: int or None = None) -> MessageClientRtnData or None:
-        s_cmd = f'{MCTask.GetMessage.value} "{key}"'
-        self.logger.info(s_cmd)
+        args = [key]
+        self.logger.info(format_exe_cmd(MCTask.GetMessage, args))
         if not with_timestamp_gap:
-            return self._run(cmd=s_cmd, timeout=timeout, max_try=max_try)
+            return self._run(MCTask.GetMessage, args, timeout=timeout, max_try=max_try)
         else:
             key_dt = self._get_timestamp(key=key, gap=with_timestamp_gap)
             if key_dt:
-                return self._run(cmd=s_cmd, timeout=timeout, max_try=max_try)
+                return self._run(MCTask.GetMessage, args, timeout=timeout, max_try=max_try)
             else:
                 return None
 
+    def send_many(self, d_key_message: Dict[str, str], timeout=5, max_try=5,
+                  with_timestamp: bool = False) -> Dict[str, MessageClientRtnData]:
+        """
+        并发发送多个 message (每个 key 一个进程, 不是一次往返); with_timestamp 时 'dt#' key 只在对应 key 成功后写入
+        """
+        s_timestamp = datetime.now().strftime('%Y%m%d %H%M%S')
+        l_key = list(d_key_message.keys())
+        items = [(MCTask.SendMessage, [key, d_key_message[key]], None) for key in l_key]
+        if with_timestamp:
+            items += [(MCTask.SendMessage, ['dt#' + key, s_timestamp], i) for i, key in enumerate(l_key)]
+        self.logger.info(f'{MCTask.SendMessage.value} many, {len(l_key)} keys')
+        l_rtn = self._run_many(items, timeout=timeout, max_try=max_try)
+        if with_timestamp:
+            for key, mcr_dt in zip(l_key, l_rtn[len(l_key):]):
+                if mcr_dt.exception:
+                    self.logger.error(f'send dt key fail, {key}')
+        return dict(zip(l_key, l_rtn[:len(l_key)]))
+
+    def get_many(self, keys: list, timeout=5, max_try=5,
+                 with_timestamp_gap: int or None = None) -> Dict[str, MessageClientRtnData or None]:
+        """
+        并发获取多个 message (每个 key 一个进程), 包括 'dt#' key
+        :return: { key: MessageClientRtnData }, timestamp 检查不通过的 key 为 None
+        """
+        l_key = list(keys)
+        items = [(MCTask.GetMessage, [key], None) for key in l_key]
+        if with_timestamp_gap:
+            items += [(MCTask.GetMessage, ['dt#' + key], None) for key in l_key]
+        self.logger.info(f'{MCTask.GetMessage.value} many, {len(l_key)} keys')
+        l_rtn = self._run_many(items, timeout=timeout, max_try=max_try)
+        d_rtn = dict(zip(l_key, l_rtn[:len(l_key)]))
+        if with_timestamp_gap:
+            for key, dt_mcr in zip(l_key, l_rtn[len(l_key):]):
+                if not self._check_timestamp(dt_mcr, with_timestamp_gap):
+                    d_rtn[key] = None
+        return d_rtn
+
+    def getfile_many(self, d_key_path: Dict[str, str], timeout=5, max_try=5,
+                     with_timestamp_gap: int or None = None) -> Dict[str, MessageClientRtnData or None]:
+        """
+        并发获取多个 file (每个 key 一个进程); with_timestamp_gap 时 先获取 'dt#' key, 只下载 timestamp 检查通过的文件
+        :param d_key_path: { key: file_path }
+        :return: { key: MessageClientRtnData }, timestamp 检查不通过的 key 为 None
+        """
+        d_key_path = {key: os.path.abspath(file_path) for key, file_path in d_key_path.items()}
+        for file_path in d_key_path.values():
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        d_rtn = {key: None for key in d_key_path}
+        l_key = list(d_key_path.keys())
+        if with_timestamp_gap:
+            d_dt_mcr = self.get_many(['dt#' + key for key in l_key], timeout=timeout, max_try=max_try)
+            l_key = [key for key in l_key if self._check_timestamp(d_dt_mcr['dt#' + key], with_timestamp_gap)]
+        if not l_key:
+            return d_rtn
+
+        items = [(MCTask.GetFile, [key, d_key_path[key]], None) for key in l_key]
+        self.logger.info(f'{MCTask.GetFile.value} many, {len(l_key)} keys')
+        d_rtn.update(zip(l_key, self._run_many(items, timeout=timeout, max_try=max_try)))
+        return d_rtn
+
     def status(self, timeout=5, max_try=5) -> MessageClientRtnData:
-        s_cmd = f'{MCTask.Status.value} '
-        self.logger.info(s_cmd)
-        return self._run(cmd=s_cmd, timeout=timeout, max_try=max_try)
+        self.logger.info(format_exe_cmd(MCTask.Status, []))
+        return self._run(MCTask.Status, [], timeout=timeout, max_try=max_try)
 
     def clear(self, key, timeout=5, max_try=5) -> MessageClientRtnData:
-        s_cmd = f'{MCTask.Clear.value} "{key}" '
-        self.logger.info(s_cmd)
-        return self._run(cmd=s_cmd, timeout=timeout, max_try=max_try)
+        args = [key]
+        self.logger.info(format_exe_cmd(MCTask.Clear, args))
+        return self._run(MCTask.Clear, args, timeout=timeout, max_try=max_try)
 
 
 
@@ -1 +1,2 @@
 from .MessageClient import MessageClientRtnData, MessageClient
+from .cache import CachedMessageClient
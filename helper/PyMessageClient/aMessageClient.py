@@ -0,0 +1,226 @@
+"""
+MessageClient 的 asyncio 版本
+
+    与 MessageClient 相同的方法, 均为协程; 多个请求可同时进行:
+        每次尝试 有独立的 timeout, 慢的 key 不会阻塞其他 key;
+        取消调用的 task 时, 对应的子进程 被 kill;
+        max_concurrency 限制 同时进行的请求数
+
+    async with AsyncMessageClient(ip, port) as amc:
+        d_mcr = await amc.get_many(keys, timeout=2)
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List
+
+try:
+    from .simpleLogger import MyLogger
+    from .constant import RunException, MCTask, MessageClientRtnData
+    from .transport import format_exe_cmd
+    from .atransport import AsyncExeTransport
+    from .MessageClient import MessageClient, PATH_MC
+    from .engine import Endpoint, RetryPolicy, CIRCUIT_OPEN_MSG, circuit_open_rtn
+except:
+    from simpleLogger import MyLogger
+    from constant import RunException, MCTask, MessageClientRtnData
+    from transport import format_exe_cmd
+    from atransport import AsyncExeTransport
+    from MessageClient import MessageClient, PATH_MC
+    from engine import Endpoint, RetryPolicy, CIRCUIT_OPEN_MSG, circuit_open_rtn
+
+
+class AsyncMessageClient:
+    TRANSPORT_OPTIONS = MessageClient.TRANSPORT_OPTIONS
+    _check_timeout_arg = staticmethod(MessageClient._check_timeout_arg)
+    _check_maxtry_arg = staticmethod(MessageClient._check_maxtry_arg)
+    _check_timestamp = MessageClient._check_timestamp
+
+    def __init__(
+            self,
+            ip, port,
+            logger: logging.Logger or None = None,
+            transport: str = 'exe',
+            max_concurrency: int = 20,
+            retry_policy: RetryPolicy or None = None,
+    ):
+        """
+        :param transport: 同 MessageClient
+        :param retry_policy: 同 MessageClient; 熔断 / 统计 与 同一 (ip, port) 的 MessageClient 共用
+        :param max_concurrency: 同时进行的请求数 上限 (即同时运行的进程数)
+        """
+        self._ip = ip
+        self._port = port
+        if isinstance(logger, logging.Logger):
+            self.logger = logger
+        else:
+            self.logger = MyLogger(name='AsyncMessageClient')
+        if transport not in self.TRANSPORT_OPTIONS:
+            raise ValueError(f'transport not in {self.TRANSPORT_OPTIONS}')
+        self._transport = AsyncExeTransport(ip=ip, port=port, cwd=PATH_MC, logger=self.logger)
+        self._max_concurrency = max(1, int(max_concurrency))
+        self._semaphore: asyncio.Semaphore or None = None
+        self._retry_policy = RetryPolicy() if retry_policy is None else retry_policy
+        self._endpoint = Endpoint.get(ip, port)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        await self._transport.close()
+
+    @property
+    def stats(self) -> dict:
+        return self._endpoint.stats.snapshot()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # 在 event loop 内创建
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._semaphore
+
+    async def _run(self, task: MCTask, args: list, timeout=5, max_try=5) -> MessageClientRtnData:
+        timeout = self._check_timeout_arg(timeout, default=5)
+        max_try = self._check_maxtry_arg(max_try, default=5)
+
+        breaker, stats = self._endpoint.breaker, self._endpoint.stats
+        stats.incr('calls')
+        for n in range(max_try):
+            if n > 0:
+                stats.incr('retries')
+                await asyncio.sleep(self._retry_policy.delay(n - 1))
+            async with self._get_semaphore():
+                if breaker.allow():
+                    t = time.perf_counter()
+                    try:
+                        rtn_data: MessageClientRtnData = await self._transport.run(
+                            task=task, args=args, timeout=timeout)
+                    except BaseException:
+                        # 被取消 (CancelledError) 时 释放 探测, 否则 熔断 一直打开
+                        breaker.release_probe()
+                        raise
+                    stats.record_attempt(time.perf_counter() - t, rtn_data.exception)
+                    self._endpoint.record(rtn_data, self.logger)
+                else:
+                    stats.incr('rejected')
+                    rtn_data = circuit_open_rtn()
+            error_type: RunException or None = rtn_data.exception
+            if not error_type:
+                return rtn_data
+            if rtn_data.msg == CIRCUIT_OPEN_MSG:
+                self.logger.error(f'MessageServer 熔断中, {format_exe_cmd(task, args)}')
+                stats.incr('failed_calls')
+                return rtn_data
+            if error_type == RunException.TimeOut:
+                self.logger.error(f'第{n + 1}次运行，超时, {format_exe_cmd(task, args)}')
+            else:
+                self.logger.error(f'第{n + 1}次运行，失败, {format_exe_cmd(task, args)}')
+        else:
+            self.logger.error('超过最大运行次数')
+        stats.incr('failed_calls')
+        return MessageClientRtnData(datetime=datetime.now(), exception=RunException.Error, msg='')
+
+    async def _send_timestamp(self, key, mcr: MessageClientRtnData) -> MessageClientRtnData:
+        if mcr.exception:
+            return mcr
+        mcr_dt = await self.sendmessage(key='dt#' + key, message=datetime.now().strftime('%Y%m%d %H%M%S'))
+        if mcr_dt.exception:
+            self.logger.error('send dt key fail')
+        return mcr
+
+    async def sendfile(self, key, file_path, timeout=5, max_try=5,
+                       with_timestamp: bool = False) -> MessageClientRtnData:
+        args = [key, file_path]
+        self.logger.info(format_exe_cmd(MCTask.SendFile, args))
+        mcr = await self._run(MCTask.SendFile, args, timeout=timeout, max_try=max_try)
+        if not with_timestamp:
+            return mcr
+        return await self._send_timestamp(key, mcr)
+
+    async def sendmessage(self, key, message, timeout=5, max_try=5,
+                          with_timestamp: bool = False) -> MessageClientRtnData:
+        args = [key, message]
+        self.logger.info(format_exe_cmd(MCTask.SendMessage, args))
+        mcr = await self._run(MCTask.SendMessage, args, timeout=timeout, max_try=max_try)
+        if not with_timestamp:
+            return mcr
+        return await self._send_timestamp(key, mcr)
+
+    async def _get_timestamp(self, key, gap) -> None or datetime:
+        dt_mcr = await self.getmessage(key='dt#' + key)
+        return self._check_timestamp(dt_mcr, gap)
+
+    async def getfile(self, key, file_path, timeout=5, max_try=5,
+                      with_timestamp_gap: int or None = None) -> MessageClientRtnData or None:
+        file_path = os.path.abspath(file_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        args = [key, file_path]
+        self.logger.info(format_exe_cmd(MCTask.GetFile, args))
+        if with_timestamp_gap:
+            if not await self._get_timestamp(key=key, gap=with_timestamp_gap):
+                return None
+        return await self._run(MCTask.GetFile, args, timeout=timeout, max_try=max_try)
+
+    async def getmessage(self, key, timeout=5, max_try=5,
+                         with_timestamp_gap: int or None = None) -> MessageClientRtnData or None:
+        args = [key]
+        self.logger.info(format_exe_cmd(MCTask.GetMessage, args))
+        if with_timestamp_gap:
+            if not await self._get_timestamp(key=key, gap=with_timestamp_gap):
+                return None
+        return await self._run(MCTask.GetMessage, args, timeout=timeout, max_try=max_try)
+
+    async def send_many(self, d_key_message: Dict[str, str], timeout=5, max_try=5,
+                        with_timestamp: bool = False) -> Dict[str, MessageClientRtnData]:
+        """
+        同时发送多个 message, 每个 key 独立超时 / 重试
+        """
+        l_key = list(d_key_message.keys())
+        l_rtn = await asyncio.gather(*[
+            self.sendmessage(key, d_key_message[key], timeout=timeout, max_try=max_try, with_timestamp=with_timestamp)
+            for key in l_key
+        ])
+        return dict(zip(l_key, l_rtn))
+
+    async def get_many(self, keys: list, timeout=5, max_try=5,
+                       with_timestamp_gap: int or None = None) -> Dict[str, MessageClientRtnData or None]:
+        """
+        同时获取多个 message, 每个 key 独立超时 / 重试
+        :return: { key: MessageClientRtnData }, timestamp 检查不通过的 key 为 None
+        """
+        l_key = list(keys)
+        l_rtn = await asyncio.gather(*[
+            self.getmessage(key, timeout=timeout, max_try=max_try, with_timestamp_gap=with_timestamp_gap)
+            for key in l_key
+        ])
+        return dict(zip(l_key, l_rtn))
+
+    async def getfile_many(self, d_key_path: Dict[str, str], timeout=5, max_try=5,
+                           with_timestamp_gap: int or None = None) -> Dict[str, MessageClientRtnData or None]:
+        """
+        同时获取多个 file
+        :param d_key_path: { key: file_path }
+        :return: { key: MessageClientRtnData }, timestamp 检查不通过的 key 为 None
+        """
+        l_key = list(d_key_path.keys())
+        l_rtn: List[MessageClientRtnData or None] = await asyncio.gather(*[
+            self.getfile(key, d_key_path[key], timeout=timeout, max_try=max_try, with_timestamp_gap=with_timestamp_gap)
+            for key in l_key
+        ])
+        return dict(zip(l_key, l_rtn))
+
+    async def status(self, timeout=5, max_try=5) -> MessageClientRtnData:
+        self.logger.info(format_exe_cmd(MCTask.Status, []))
+        return await self._run(MCTask.Status, [], timeout=timeout, max_try=max_try)
+
+    async def clear(self, key, timeout=5, max_try=5) -> MessageClientRtnData:
+        args = [key]
+        self.logger.info(format_exe_cmd(MCTask.Clear, args))
+        return await self._run(MCTask.Clear, args, timeout=timeout, max_try=max_try)
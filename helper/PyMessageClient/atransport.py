@@ -0,0 +1,70 @@
+"""
+MessageClient 异步传输层 (asyncio)
+
+    AsyncExeTransport: asyncio 子进程 调用 TradingPlatform.MessageClient.exe, 多个进程可同时运行
+                       (Windows + python3.7 需要 ProactorEventLoop); 每次调用 仍启动一个进程
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+
+try:
+    from .constant import RunException, MCTask, MessageClientRtnData
+    from .transport import format_exe_cmd
+except:
+    from constant import RunException, MCTask, MessageClientRtnData
+    from transport import format_exe_cmd
+
+
+def _kill(p: asyncio.subprocess.Process):
+    try:
+        p.kill()
+    except ProcessLookupError:
+        pass
+
+
+class AsyncExeTransport:
+    def __init__(self, ip, port, cwd, logger: logging.Logger):
+        self._ip = ip
+        self._port = port
+        self._cwd = cwd
+        self.logger = logger
+
+    async def run(self, task: MCTask, args: list, timeout) -> MessageClientRtnData:
+        s_cmd = f'TradingPlatform.MessageClient.exe {self._ip} {self._port} {format_exe_cmd(task, args)}'
+        try:
+            p = await asyncio.create_subprocess_shell(s_cmd, cwd=self._cwd, stdout=asyncio.subprocess.PIPE)
+        except asyncio.CancelledError:
+            # python3.7 中 CancelledError 是 Exception 的子类
+            raise
+        except Exception as e:
+            self.logger.error('调用 MessageClient 失败:')
+            self.logger.error(e)
+            return MessageClientRtnData(datetime=datetime.now(), exception=RunException.Error, msg=str(e))
+
+        try:
+            outs, errs = await asyncio.wait_for(p.communicate(), timeout=timeout)
+            output_s = str(outs, encoding="utf-8")
+        except asyncio.TimeoutError as e:
+            _kill(p)
+            self.logger.error('调用 MessageClient 超时:')
+            self.logger.error(f'{s_cmd}, timeout {timeout}s')
+            return MessageClientRtnData(datetime=datetime.now(), exception=RunException.TimeOut, msg=str(e))
+        except asyncio.CancelledError:
+            _kill(p)
+            raise
+        except Exception as e:
+            _kill(p)
+            self.logger.error('调用 MessageClient 失败:')
+            self.logger.error(e)
+            return MessageClientRtnData(datetime=datetime.now(), exception=RunException.Error, msg=str(e))
+
+        if 'Exception' in output_s:
+            self.logger.warning('调用 MessageClient 失败:')
+            self.logger.warning(output_s)
+            return MessageClientRtnData(datetime=datetime.now(), exception=RunException.TimeOut, msg=output_s)
+        return MessageClientRtnData(datetime=datetime.now(), exception=None, msg=output_s.split('<<')[-1].strip())
+
+    async def close(self):
+        pass
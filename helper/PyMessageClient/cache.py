@@ -0,0 +1,262 @@
+"""
+MessageClient 的 本地缓存 (read-through), 可选使用
+
+    getmessage / getfile 使用 with_timestamp_gap 时:
+        1. 缓存中的 dt# 时间 仍在 gap 内 (且距上次检查 不超过 max_age), 直接返回缓存, 不访问 server;
+        2. 否则 只获取 dt#key, 时间未变化 时返回缓存, 变化时 才重新下载;
+    没有 with_timestamp_gap 的调用 无法判断是否变化, 直接访问 server
+
+    缓存按 LRU 保留 max_entries 个 key; 文件的缓存副本 保存在 cache_root, 写入 file_path 时 先写临时文件再替换
+    dt# 时间 精度为秒, 同一秒内的多次发送 无法区分
+
+    mc = CachedMessageClient(MessageClient(ip, port), max_age=10)
+    mc.getmessage('key', with_timestamp_gap=60)
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+from typing import Dict
+
+try:
+    from .constant import MessageClientRtnData
+    from .MessageClient import MessageClient
+    from .delta import BASE_KEY_PREFIX
+except:
+    from constant import MessageClientRtnData
+    from MessageClient import MessageClient
+    from delta import BASE_KEY_PREFIX
+
+
+@dataclass
+class _CacheEntry:
+    dt_timestamp: datetime
+    rtn_data: MessageClientRtnData
+    # 上次与 server 确认 dt# 的时间 (time.monotonic)
+    checked_at: float
+    # getfile: 缓存副本 路径; 上次写入的 file_path 及其 (size, mtime)
+    blob_path: str or None = None
+    file_path: str or None = None
+    file_stat: tuple or None = None
+
+
+class CachedMessageClient:
+    def __init__(
+            self,
+            client: MessageClient,
+            max_entries: int = 1000,
+            max_age: float or None = None,
+            cache_root: str or None = None,
+            logger: logging.Logger or None = None,
+    ):
+        """
+        :param client: MessageClient
+        :param max_entries: 最多缓存的 key 数量, 超过时 删除最久未使用的
+        :param max_age: 缓存 最多多少秒 不与 server 确认 dt#; None: dt# 时间 仍在 gap 内 即不确认
+        :param cache_root: getfile 缓存副本 的目录, 默认为临时目录
+        """
+        self._client = client
+        self._max_entries = max(1, int(max_entries))
+        self._max_age = max_age
+        if cache_root is None:
+            cache_root = tempfile.mkdtemp(prefix='MessageClientCache_')
+        os.makedirs(cache_root, exist_ok=True)
+        self._cache_root = cache_root
+        if isinstance(logger, logging.Logger):
+            self.logger = logger
+        else:
+            self.logger = client.logger
+
+        # { (task, key): _CacheEntry }
+        self._entries: 'OrderedDict[tuple, _CacheEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+
+    def __getattr__(self, item):
+        # 其他 不写入 key 的方法 (status, get_many ...) 直接使用 client; 写入 key 的方法 需要 invalidate
+        return getattr(self._client, item)
+
+    def close(self):
+        self._client.close()
+
+    def _get_entry(self, cache_key) -> _CacheEntry or None:
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+            return entry
+
+    def _put_entry(self, cache_key, entry: _CacheEntry):
+        l_evicted = []
+        with self._lock:
+            old = self._entries.pop(cache_key, None)
+            if (old is not None) and (old.blob_path != entry.blob_path):
+                l_evicted.append(old)
+            self._entries[cache_key] = entry
+            while len(self._entries) > self._max_entries:
+                l_evicted.append(self._entries.popitem(last=False)[1])
+        for old in l_evicted:
+            self._remove_blob(old)
+
+    def invalidate(self, key):
+        l_entry = []
+        with self._lock:
+            for cache_key in [cache_key for cache_key in self._entries if cache_key[1] == key]:
+                l_entry.append(self._entries.pop(cache_key))
+        for entry in l_entry:
+            self._remove_blob(entry)
+
+    @staticmethod
+    def _remove_blob(entry: _CacheEntry):
+        if entry.blob_path is not None:
+            try:
+                os.remove(entry.blob_path)
+            except OSError:
+                pass
+
+    def _is_fresh(self, entry: _CacheEntry, gap) -> bool:
+        if (datetime.now() - entry.dt_timestamp).total_seconds() > gap:
+            return False
+        if (self._max_age is not None) and (time.monotonic() - entry.checked_at > self._max_age):
+            return False
+        return True
+
+    def _fetch_timestamp(self, key, gap, timeout, max_try) -> datetime or None:
+        dt_mcr = self._client.getmessage(key='dt#' + key, timeout=timeout, max_try=max_try)
+        return self._client._check_timestamp(dt_mcr, gap)
+
+    def _lookup(self, cache_key, key, gap, timeout, max_try) -> tuple:
+        """
+        :return: (可用的缓存, None) 或 (None, server 的 dt# 时间); dt# 检查不通过时 (None, None)
+        """
+        entry = self._get_entry(cache_key)
+        if (entry is not None) and self._is_fresh(entry, gap):
+            self.hits += 1
+            return entry, None
+        dt_timestamp = self._fetch_timestamp(key, gap, timeout, max_try)
+        if dt_timestamp is None:
+            self.invalidate(key)
+            return None, None
+        if (entry is not None) and (entry.dt_timestamp == dt_timestamp):
+            self.revalidations += 1
+            entry.checked_at = time.monotonic()
+            return entry, None
+        self.misses += 1
+        return None, dt_timestamp
+
+    def getmessage(self, key, timeout=5, max_try=5,
+                   with_timestamp_gap: int or None = None) -> MessageClientRtnData or None:
+        if not with_timestamp_gap:
+            return self._client.getmessage(key, timeout=timeout, max_try=max_try)
+
+        cache_key = ('getmessage', key)
+        entry, dt_timestamp = self._lookup(cache_key, key, with_timestamp_gap, timeout, max_try)
+        if entry is not None:
+            return entry.rtn_data
+        if dt_timestamp is None:
+            return None
+        mcr = self._client.getmessage(key, timeout=timeout, max_try=max_try)
+        if not mcr.exception:
+            self._put_entry(cache_key, _CacheEntry(
+                dt_timestamp=dt_timestamp, rtn_data=mcr, checked_at=time.monotonic()))
+        return mcr
+
+    @staticmethod
+    def _file_stat(file_path) -> tuple or None:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    @staticmethod
+    def _copy_atomic(src, file_path):
+        fd, path_tmp = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(src, path_tmp)
+            os.replace(path_tmp, file_path)
+        except Exception:
+            if os.path.exists(path_tmp):
+                os.remove(path_tmp)
+            raise
+
+    def getfile(self, key, file_path, timeout=5, max_try=5,
+                with_timestamp_gap: int or None = None) -> MessageClientRtnData or None:
+        if not with_timestamp_gap:
+            return self._client.getfile(key, file_path, timeout=timeout, max_try=max_try)
+
+        file_path = os.path.abspath(file_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        cache_key = ('getfile', key)
+        entry, dt_timestamp = self._lookup(cache_key, key, with_timestamp_gap, timeout, max_try)
+        if entry is not None:
+            # 目标文件 仍是上次写入的内容 时 不需要复制
+            if (entry.file_path != file_path) or (self._file_stat(file_path) != entry.file_stat):
+                self._copy_atomic(entry.blob_path, file_path)
+                entry.file_path, entry.file_stat = file_path, self._file_stat(file_path)
+            return entry.rtn_data
+        if dt_timestamp is None:
+            return None
+
+        # 先下载到 同目录的临时文件, 成功后 替换 file_path
+        fd, path_tmp = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix='.tmp')
+        os.close(fd)
+        try:
+            mcr = self._client.getfile(key, path_tmp, timeout=timeout, max_try=max_try)
+            if mcr.exception:
+                return mcr
+            fd, blob_path = tempfile.mkstemp(
+                dir=self._cache_root, prefix=hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + '_')
+            os.close(fd)
+            shutil.copyfile(path_tmp, blob_path)
+            os.replace(path_tmp, file_path)
+        finally:
+            if os.path.exists(path_tmp):
+                os.remove(path_tmp)
+        self._put_entry(cache_key, _CacheEntry(
+            dt_timestamp=dt_timestamp, rtn_data=mcr, checked_at=time.monotonic(),
+            blob_path=blob_path, file_path=file_path, file_stat=self._file_stat(file_path)))
+        return mcr
+
+    def sendmessage(self, key, message, timeout=5, max_try=5, with_timestamp: bool = False) -> MessageClientRtnData:
+        self.invalidate(key)
+        return self._client.sendmessage(key, message, timeout=timeout, max_try=max_try, with_timestamp=with_timestamp)
+
+    def sendfile(self, key, file_path, timeout=5, max_try=5, with_timestamp: bool = False) -> MessageClientRtnData:
+        self.invalidate(key)
+        return self._client.sendfile(key, file_path, timeout=timeout, max_try=max_try, with_timestamp=with_timestamp)
+
+    def clear(self, key, timeout=5, max_try=5) -> MessageClientRtnData:
+        self.invalidate(key)
+        return self._client.clear(key, timeout=timeout, max_try=max_try)
+
+    def sendfile_stream(self, key, file_path, timeout=5, max_try=5,
+                        with_timestamp: bool = False) -> MessageClientRtnData:
+        self.invalidate(key)
+        return self._client.sendfile_stream(
+            key, file_path, timeout=timeout, max_try=max_try, with_timestamp=with_timestamp)
+
+    def sendfile_delta(self, key, file_path, state_root, timeout=5, max_try=5, with_timestamp: bool = False,
+                       rebase_ratio=0.5, max_deltas=50) -> MessageClientRtnData:
+        self.invalidate(key)
+        self.invalidate(BASE_KEY_PREFIX + key)
+        return self._client.sendfile_delta(
+            key, file_path, state_root, timeout=timeout, max_try=max_try, with_timestamp=with_timestamp,
+            rebase_ratio=rebase_ratio, max_deltas=max_deltas)
+
+    def send_many(self, d_key_message: Dict[str, str], timeout=5, max_try=5,
+                  with_timestamp: bool = False) -> Dict[str, MessageClientRtnData]:
+        for key in d_key_message:
+            self.invalidate(key)
+        return self._client.send_many(d_key_message, timeout=timeout, max_try=max_try, with_timestamp=with_timestamp)
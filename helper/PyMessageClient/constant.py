@@ -0,0 +1,26 @@
+from datetime import datetime
+from enum import Enum
+from dataclasses import dataclass
+
+
+class RunException(Enum):
+    """
+    """
+    TimeOut = 0
+    Error = -1
+
+
+class MCTask(Enum):
+    SendFile = 'sendfile'
+    SendMessage = 'sendmessage'
+    GetFile = 'getfile'
+    GetMessage = 'getmessage'
+    Status = 'status'
+    Clear = 'clear'
+
+
+@dataclass
+class MessageClientRtnData:
+    datetime: datetime
+    exception: RunException or None
+    msg: str = ''
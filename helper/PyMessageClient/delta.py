@@ -0,0 +1,153 @@
+"""
+增量 / 压缩 发布文件 (sendfile_delta / getfile_delta)
+
+    server 上每个 key 有两个文件:
+        'base#<key>': 基准版本 (完整, gzip)
+        '<key>':      信封, 完整内容 (F) 或 相对基准版本的 增量 (D), gzip 压缩
+    发送方 在 state_root 保存 上次发布的 基准版本, 只发送 相对基准的 按行增量;
+        没有基准 / 增量超过 完整压缩大小 * rebase_ratio / 连续 max_deltas 次增量 时, 重新发布基准
+    接收方 在 state_root 保存 基准版本, 本地没有 或 与信封中的基准不一致 时 下载 'base#<key>'
+    增量按行计算 (适合 CSV), 需要将文件 读入内存
+
+    信封格式: MAGIC + mode (1 字节) + 基准 sha256 (32 字节) + 内容 sha256 (32 字节) + gzip(payload)
+"""
+
+import os
+import gzip
+import json
+import struct
+import hashlib
+import tempfile
+from typing import Tuple
+
+MAGIC = b'MCD1'
+MODE_FULL = b'F'
+MODE_DELTA = b'D'
+BASE_KEY_PREFIX = 'base#'
+
+_OP_COPY = struct.Struct('>cII')
+_OP_INSERT = struct.Struct('>cI')
+_ENVELOPE_HEADER = struct.Struct('>4sc32s32s')
+
+
+class DeltaError(Exception):
+    pass
+
+
+def sha256_digest(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def make_delta(base: bytes, target: bytes) -> bytes:
+    """
+    按行 比较, 生成 [COPY(基准行号, 行数) / INSERT(内容)] 序列
+    """
+    l_base = base.splitlines(keepends=True)
+    l_target = target.splitlines(keepends=True)
+    d_index = {}
+    for n, line in enumerate(l_base):
+        d_index.setdefault(line, n)
+
+    buf = bytearray()
+    l_literal = []
+
+    def _flush_literal():
+        if l_literal:
+            literal = b''.join(l_literal)
+            buf.extend(_OP_INSERT.pack(b'I', len(literal)))
+            buf.extend(literal)
+            l_literal.clear()
+
+    i = 0
+    while i < len(l_target):
+        j = d_index.get(l_target[i])
+        if j is None:
+            l_literal.append(l_target[i])
+            i += 1
+            continue
+        k = 1
+        while (i + k < len(l_target)) and (j + k < len(l_base)) and (l_target[i + k] == l_base[j + k]):
+            k += 1
+        _flush_literal()
+        buf.extend(_OP_COPY.pack(b'C', j, k))
+        i += k
+    _flush_literal()
+    return bytes(buf)
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    l_base = base.splitlines(keepends=True)
+    l_out = []
+    pos = 0
+    while pos < len(delta):
+        op = delta[pos: pos + 1]
+        if op == b'C':
+            _, start, count = _OP_COPY.unpack_from(delta, pos)
+            pos += _OP_COPY.size
+            if start + count > len(l_base):
+                raise DeltaError('copy out of base range')
+            l_out.extend(l_base[start: start + count])
+        elif op == b'I':
+            _, size = _OP_INSERT.unpack_from(delta, pos)
+            pos += _OP_INSERT.size
+            l_out.append(delta[pos: pos + size])
+            pos += size
+        else:
+            raise DeltaError(f'unknown delta op: {op}')
+    return b''.join(l_out)
+
+
+def pack_envelope(mode: bytes, base_digest: bytes, target_digest: bytes, payload: bytes) -> bytes:
+    return _ENVELOPE_HEADER.pack(MAGIC, mode, base_digest, target_digest) + gzip.compress(payload)
+
+
+def unpack_envelope(data: bytes) -> Tuple[bytes, bytes, bytes, bytes]:
+    """
+    :return: (mode, base_digest, target_digest, payload)
+    """
+    if len(data) < _ENVELOPE_HEADER.size:
+        raise DeltaError('envelope too short')
+    magic, mode, base_digest, target_digest = _ENVELOPE_HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise DeltaError('not a delta envelope')
+    return mode, base_digest, target_digest, gzip.decompress(data[_ENVELOPE_HEADER.size:])
+
+
+class DeltaState:
+    """
+    state_root 下 每个 key 的 基准版本: '<sha1(key)>.base' 与 '<sha1(key)>.json' ({digest, deltas})
+    """
+    def __init__(self, state_root):
+        os.makedirs(state_root, exist_ok=True)
+        self._state_root = state_root
+
+    def _path(self, key, ext) -> str:
+        return os.path.join(self._state_root, f'{hashlib.sha1(key.encode("utf-8")).hexdigest()}.{ext}')
+
+    def load(self, key) -> Tuple[bytes or None, dict]:
+        """
+        :return: (基准内容, meta), 没有 或 损坏时 (None, {})
+        """
+        try:
+            with open(self._path(key, 'json'), encoding='utf-8') as f:
+                d_meta = json.load(f)
+            with open(self._path(key, 'base'), 'rb') as f:
+                base = f.read()
+        except (OSError, ValueError):
+            return None, {}
+        if sha256_digest(base).hex() != d_meta.get('digest'):
+            return None, {}
+        return base, d_meta
+
+    def _write_atomic(self, path, data: bytes):
+        fd, path_tmp = tempfile.mkstemp(dir=self._state_root, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(path_tmp, path)
+
+    def save(self, key, base: bytes, deltas: int = 0):
+        self._write_atomic(self._path(key, 'base'), base)
+        self.save_meta(key, {'digest': sha256_digest(base).hex(), 'deltas': deltas})
+
+    def save_meta(self, key, d_meta: dict):
+        self._write_atomic(self._path(key, 'json'), json.dumps(d_meta).encode('utf-8'))
@@ -0,0 +1,301 @@
+"""
+MessageClient 调用引擎, MessageClient / AsyncMessageClient / tp_MessageClient 共用
+
+    RetryPolicy:    重试间隔 指数退避 + 随机抖动, 避免所有调用方 同时重试
+    CircuitBreaker: 每个 (ip, port) 一个; 连续超时 failure_threshold 次后 打开,
+                    reset_timeout 秒内的调用 直接失败 (不启动进程 / 不连接),
+                    之后允许 一个探测请求, 成功则关闭
+    EndpointStats:  每个 (ip, port) 的 请求 / 重试 / 超时 / 熔断 次数 与 延迟
+
+    同一进程内 相同 (ip, port) 的 所有调用方 共用 CircuitBreaker 和 EndpointStats
+"""
+
+import time
+import random
+import threading
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+try:
+    from .constant import RunException, MCTask, MessageClientRtnData
+    from .transport import ExeTransport, format_exe_cmd, DEFAULT_BATCH_CONCURRENCY
+except:
+    from constant import RunException, MCTask, MessageClientRtnData
+    from transport import ExeTransport, format_exe_cmd, DEFAULT_BATCH_CONCURRENCY
+
+
+CIRCUIT_OPEN_MSG = 'circuit open'
+
+
+@dataclass
+class RetryPolicy:
+    max_try: int = 5
+    # 第 n 次重试前 等待 uniform(0, min(backoff_max, backoff_base * 2 ** n)) 秒 (full jitter)
+    backoff_base: float = 0.2
+    backoff_max: float = 10.
+
+    def delay(self, n) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** n))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float or None = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """
+        关闭时 允许; 打开 reset_timeout 秒后 只允许一个探测请求
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or (time.monotonic() - self._opened_at < self.reset_timeout):
+                return False
+            self._probing = True
+            return True
+
+    def release_probe(self):
+        """
+        请求 没有结果 (被取消 / 异常) 时 调用; 若为探测请求, 按 探测失败 重新计时, 允许之后的探测
+        """
+        with self._lock:
+            if self._probing:
+                self._probing = False
+                self._opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> bool:
+        """
+        :return: 是否 因此次失败 打开
+        """
+        with self._lock:
+            self._failures += 1
+            if self._probing:
+                # 探测失败, 重新计时
+                self._probing = False
+                self._opened_at = time.monotonic()
+                return False
+            if (self._opened_at is None) and (self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+
+class EndpointStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.rejected = 0
+        self.failed_calls = 0
+        self.latency_sum = 0.
+        self.latency_max = 0.
+
+    def record_attempt(self, latency, exception: RunException or None):
+        with self._lock:
+            self.attempts += 1
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+            if exception == RunException.TimeOut:
+                self.timeouts += 1
+            elif exception is not None:
+                self.errors += 1
+
+    def incr(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'attempts': self.attempts,
+                'retries': self.retries,
+                'timeouts': self.timeouts,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'failed_calls': self.failed_calls,
+                'latency_avg': self.latency_sum / self.attempts if self.attempts else 0.,
+                'latency_max': self.latency_max,
+            }
+
+
+class Endpoint:
+    # 进程内共享 { (ip, port): Endpoint }
+    _endpoints: Dict[Tuple[str, int], 'Endpoint'] = {}
+    _endpoints_lock = threading.Lock()
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.stats = EndpointStats()
+
+    def record(self, rtn_data: MessageClientRtnData, logger: logging.Logger):
+        # 只有 超时 计入熔断; server 返回的错误 (如 key 不存在) 说明 server 正常
+        if rtn_data.exception == RunException.TimeOut:
+            if self.breaker.record_failure():
+                logger.error(f'MessageServer 连续超时 {self.breaker.failure_threshold} 次, '
+                             f'{self.breaker.reset_timeout}s 内直接失败')
+        else:
+            self.breaker.record_success()
+
+    @classmethod
+    def get(cls, ip, port, failure_threshold=5, reset_timeout=30.) -> 'Endpoint':
+        key = (str(ip), int(port))
+        with cls._endpoints_lock:
+            endpoint = cls._endpoints.get(key)
+            if endpoint is None:
+                endpoint = Endpoint(CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout))
+                cls._endpoints[key] = endpoint
+            return endpoint
+
+
+def get_stats() -> Dict[str, dict]:
+    """
+    :return: { 'ip:port': EndpointStats.snapshot() }
+    """
+    with Endpoint._endpoints_lock:
+        l_endpoint = list(Endpoint._endpoints.items())
+    return {f'{ip}:{port}': endpoint.stats.snapshot() for (ip, port), endpoint in l_endpoint}
+
+
+def circuit_open_rtn() -> MessageClientRtnData:
+    return MessageClientRtnData(datetime=datetime.now(), exception=RunException.Error, msg=CIRCUIT_OPEN_MSG)
+
+
+class MessageEngine:
+    TRANSPORT_OPTIONS = ['exe']
+
+    def __init__(
+            self,
+            ip, port,
+            cwd,
+            logger: logging.Logger,
+            transport: str = 'exe',
+            retry_policy: RetryPolicy or None = None,
+            max_concurrency=DEFAULT_BATCH_CONCURRENCY,
+    ):
+        """
+        :param cwd: TradingPlatform.MessageClient.exe 所在目录
+        :param max_concurrency: run_many 同时运行的 进程数
+        """
+        if transport not in self.TRANSPORT_OPTIONS:
+            raise ValueError(f'transport not in {self.TRANSPORT_OPTIONS}')
+        self.logger = logger
+        self.transport = ExeTransport(ip=ip, port=port, cwd=cwd, logger=logger, max_concurrency=max_concurrency)
+        self.retry_policy = RetryPolicy() if retry_policy is None else retry_policy
+        self.endpoint = Endpoint.get(ip, port)
+
+    def close(self):
+        self.transport.close()
+
+    def _attempt(self, task: MCTask, args: list, timeout) -> MessageClientRtnData:
+        breaker = self.endpoint.breaker
+        if not breaker.allow():
+            self.endpoint.stats.incr('rejected')
+            return circuit_open_rtn()
+        t = time.perf_counter()
+        try:
+            rtn_data = self.transport.run(task=task, args=args, timeout=timeout)
+        except BaseException:
+            breaker.release_probe()
+            raise
+        self.endpoint.stats.record_attempt(time.perf_counter() - t, rtn_data.exception)
+        self.endpoint.record(rtn_data, self.logger)
+        return rtn_data
+
+    def run(self, task: MCTask, args: list, timeout=5, max_try: int or None = None) -> MessageClientRtnData:
+        max_try = self.retry_policy.max_try if max_try is None else max_try
+        self.endpoint.stats.incr('calls')
+        for n in range(max_try):
+            if n > 0:
+                self.endpoint.stats.incr('retries')
+                time.sleep(self.retry_policy.delay(n - 1))
+            rtn_data = self._attempt(task, args, timeout)
+            error_type: RunException or None = rtn_data.exception
+            if not error_type:
+                return rtn_data
+            if rtn_data.msg == CIRCUIT_OPEN_MSG:
+                self.logger.error(f'MessageServer 熔断中, {format_exe_cmd(task, args)}')
+                self.endpoint.stats.incr('failed_calls')
+                return rtn_data
+            if error_type == RunException.TimeOut:
+                self.logger.error(f'第{n + 1}次运行，超时')
+            else:
+                self.logger.error(f'第{n + 1}次运行，失败')
+        else:
+            self.logger.error('超过最大运行次数')
+        self.endpoint.stats.incr('failed_calls')
+        return MessageClientRtnData(datetime=datetime.now(), exception=RunException.Error, msg='')
+
+    def run_many(self, items: List[tuple], timeout=5, max_try: int or None = None) -> List[MessageClientRtnData]:
+        """
+        批量运行 (exe: 每个 item 一个进程, 并发运行), 每次重试只重新运行失败的部分
+        :param items: [(task, args, after), ], after: 依赖的 item 下标, 该 item 成功后才运行
+        """
+        max_try = self.retry_policy.max_try if max_try is None else max_try
+        breaker = self.endpoint.breaker
+        stats = self.endpoint.stats
+        stats.incr('calls', len(items))
+
+        l_rtn: List[MessageClientRtnData] = [circuit_open_rtn() for _ in items]
+        l_pending = list(range(len(items)))
+        for n in range(max_try):
+            if n > 0:
+                stats.incr('retries', len(l_pending))
+                time.sleep(self.retry_policy.delay(n - 1))
+            if not breaker.allow():
+                stats.incr('rejected', len(l_pending))
+                self.logger.error(f'MessageServer 熔断中, {len(l_pending)} 个命令未运行')
+                break
+            # 依赖的 item 已成功时 不再需要 after; 否则换算为本批次内的下标
+            d_position = {i: position for position, i in enumerate(l_pending)}
+            l_batch = []
+            for i in l_pending:
+                task, args, after = items[i]
+                l_batch.append((task, args, d_position.get(after)))
+            t = time.perf_counter()
+            try:
+                l_batch_rtn = self.transport.run_batch(items=l_batch, timeout=timeout)
+            except BaseException:
+                breaker.release_probe()
+                raise
+            latency = time.perf_counter() - t
+
+            l_failed = []
+            for i, rtn_data in zip(l_pending, l_batch_rtn):
+                stats.record_attempt(latency, rtn_data.exception)
+                l_rtn[i] = rtn_data
+                if rtn_data.exception:
+                    l_failed.append(i)
+            # 整批超时 只计一次
+            l_timeout = [rtn_data for rtn_data in l_batch_rtn if rtn_data.exception == RunException.TimeOut]
+            self.endpoint.record(
+                l_timeout[0] if l_timeout else MessageClientRtnData(datetime=datetime.now(), exception=None),
+                self.logger)
+            if not l_failed:
+                break
+            self.logger.error(f'第{n + 1}次运行，{len(l_failed)}/{len(l_pending)} 失败')
+            l_pending = l_failed
+        else:
+            self.logger.error('超过最大运行次数')
+        stats.incr('failed_calls', sum(1 for rtn_data in l_rtn if rtn_data.exception))
+        return l_rtn
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+MyLogger 队列模式 使用的 handler / listener
+    helper/simpleLogger.py 与 helper/PyMessageClient/simpleLogger.py 共用
+"""
+
+import queue
+import atexit
+import weakref
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+
+# 队列满时 丢弃 (drop) 或 等待 (block)
+class BoundedQueueHandler(QueueHandler):
+    POLICY_OPTIONS = ['drop', 'block']
+
+    def __init__(self, q: queue.Queue, policy='drop'):
+        super(BoundedQueueHandler, self).__init__(q)
+        if policy not in self.POLICY_OPTIONS:
+            raise ValueError(f'policy not in {self.POLICY_OPTIONS}')
+        self.policy = policy
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.policy == 'block':
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BoundedQueueListener(QueueListener):
+    # 队列有界, 停止时 等待队列有空位 再放入结束标记
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+# 进程退出时 close 所有 使用队列的 logger (输出剩余日志, 停止后台线程)
+_live_loggers = weakref.WeakSet()
+
+
+def register_queue_logger(logger: logging.Logger):
+    """
+    :param logger: 需要有 close() 方法, 可重复调用
+    """
+    _live_loggers.add(logger)
+
+
+@atexit.register
+def _close_live_loggers():
+    for logger in list(_live_loggers):
+        logger.close()
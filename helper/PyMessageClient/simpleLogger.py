@@ -5,9 +5,15 @@
 
 
 import logging
+import queue
 import datetime
 import os
 
+try:
+    from .queuelogging import BoundedQueueHandler, BoundedQueueListener, register_queue_logger
+except:
+    from queuelogging import BoundedQueueHandler, BoundedQueueListener, register_queue_logger
+
 
 # logger计数
 class MsgCounterHandler(logging.Handler):
@@ -31,8 +37,14 @@ class MyLogger(logging.Logger):
             is_file=True, output_root=None,
             file_name='log.txt', file_backup_count=15, file_level=logging.INFO,
             format_string='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            file_format_string='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+            file_format_string='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            use_queue=False, queue_size=10000, queue_policy='drop',
     ):
+        """
+        :param use_queue: stream / file handler 在后台线程 格式化后输出, 调用方 只放入队列
+        :param queue_size: 队列大小
+        :param queue_policy: 队列满时 'drop': 丢弃; 'block': 等待
+        """
         self.name = name
         self.level = level
         logging.Logger.__init__(self, self.name, self.level)
@@ -53,7 +65,13 @@ class MyLogger(logging.Logger):
             self.__setFileHandler__(output_root=path_file_output_root,
                                     format_string=file_format_string,
                                     level=file_level, backup_count=file_backup_count)
-        # (3)count handler
+        # (3)queue handler
+        self._queue_handler = None
+        self._queue_listener = None
+        if use_queue:
+            self.__setQueueHandler__(queue_size=queue_size, policy=queue_policy)
+
+        # (4)count handler
         self.__setMsgCountHandler__()
 
     # console输出
@@ -77,6 +95,34 @@ class MyLogger(logging.Logger):
         file_handler.setFormatter(logging.Formatter(format_string))
         self.addHandler(file_handler)
 
+    # 已添加的 handler 改为 由后台线程 输出
+    def __setQueueHandler__(self, queue_size, policy):
+        l_handler = list(self.handlers)
+        for handler in l_handler:
+            self.removeHandler(handler)
+        q = queue.Queue(maxsize=queue_size)
+        self._queue_handler = BoundedQueueHandler(q, policy=policy)
+        self.addHandler(self._queue_handler)
+        self._queue_listener = BoundedQueueListener(q, *l_handler, respect_handler_level=True)
+        self._queue_listener.start()
+        register_queue_logger(self)
+
+    def close(self):
+        """
+        输出队列中 剩余的日志, 停止后台线程; 之后的日志 直接输出
+        """
+        listener, self._queue_listener = self._queue_listener, None
+        if listener is None:
+            return
+        listener.stop()
+        self.removeHandler(self._queue_handler)
+        for handler in listener.handlers:
+            self.addHandler(handler)
+
+    @property
+    def dropped(self) -> int:
+        return self._queue_handler.dropped if self._queue_handler is not None else 0
+
     # 统计状态个数
     def __setMsgCountHandler__(self):
         self._mch = MsgCounterHandler()
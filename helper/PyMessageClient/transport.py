@@ -0,0 +1,118 @@
+"""
+MessageClient 传输层
+
+    ExeTransport: 每次调用 启动 TradingPlatform.MessageClient.exe
+
+    MessageServer 的 通信协议 不在本仓库中, 因此 每次调用 仍然需要启动一个进程, 进程启动的开销 没有减少;
+    run_batch 只是 并发运行 多个进程 (最多 max_concurrency 个), 不是一次往返
+"""
+
+import os
+import threading
+import subprocess
+import logging
+from datetime import datetime
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .constant import RunException, MCTask, MessageClientRtnData
+except:
+    from constant import RunException, MCTask, MessageClientRtnData
+
+
+SKIPPED_MSG = 'skipped'
+# run_batch 同时运行的 进程数
+DEFAULT_BATCH_CONCURRENCY = 8
+
+
+def format_exe_cmd(task: MCTask, args: list) -> str:
+    """
+    sendfile "key" "path"
+    """
+    return ' '.join([task.value] + [f'"{arg}"' for arg in args])
+
+
+class ExeTransport:
+    def __init__(self, ip, port, cwd, logger: logging.Logger, max_concurrency=DEFAULT_BATCH_CONCURRENCY):
+        self._ip = ip
+        self._port = port
+        self._cwd = cwd
+        self.logger = logger
+        self._max_concurrency = max(1, int(max_concurrency))
+
+    def run(self, task: MCTask, args: list, timeout) -> MessageClientRtnData:
+        s_cmd = f'TradingPlatform.MessageClient.exe {self._ip} {self._port} {format_exe_cmd(task, args)}'
+        p = subprocess.Popen(
+            s_cmd,
+            cwd=self._cwd,
+            stdout=subprocess.PIPE,
+            shell=True,
+        )
+
+        try:
+            outs, errs = p.communicate(timeout=timeout)
+            output_s = str(outs, encoding="utf-8")
+        except subprocess.TimeoutExpired as e:
+            p.kill()
+            self.logger.error('调用 MessageClient 超时:')
+            self.logger.error(e)
+            return MessageClientRtnData(datetime=datetime.now(), exception=RunException.TimeOut, msg=str(e))
+        except Exception as e:
+            p.kill()
+            self.logger.error('调用 MessageClient 失败:')
+            self.logger.error(e)
+            return MessageClientRtnData(datetime=datetime.now(), exception=RunException.Error, msg=str(e))
+        else:
+            if 'Exception' in output_s:
+                p.kill()
+                self.logger.warning('调用 MessageClient 失败:')
+                self.logger.warning(output_s)
+                return MessageClientRtnData(datetime=datetime.now(), exception=RunException.TimeOut, msg=output_s)
+            else:
+                p.kill()
+                return MessageClientRtnData(
+                    datetime=datetime.now(), exception=None, msg=output_s.split('<<')[-1].strip())
+
+    def run_batch(self, items: List[tuple], timeout) -> List[MessageClientRtnData]:
+        """
+        每个 item 一个进程, 最多 max_concurrency 个 同时运行; after 依赖的 item 完成后 才运行
+        :param items: [(task, args, after), ]
+        """
+        l_rtn: List[MessageClientRtnData or None] = [None] * len(items)
+        l_pending = list(range(len(items)))
+        with ThreadPoolExecutor(max_workers=min(self._max_concurrency, max(1, len(items)))) as executor:
+            while l_pending:
+                # 本轮: 没有依赖 或 依赖已完成 的 item
+                l_ready, l_wait = [], []
+                for i in l_pending:
+                    after = items[i][2]
+                    if (after is None) or (l_rtn[after] is not None):
+                        l_ready.append(i)
+                    else:
+                        l_wait.append(i)
+                if not l_ready:
+                    raise ValueError('run_batch: circular "after" dependency')
+                l_run = []
+                for i in l_ready:
+                    after = items[i][2]
+                    if (after is not None) and l_rtn[after].exception:
+                        l_rtn[i] = MessageClientRtnData(
+                            datetime=datetime.now(), exception=RunException.Error, msg=SKIPPED_MSG)
+                    else:
+                        l_run.append(i)
+                for i, rtn_data in zip(l_run, executor.map(
+                        lambda i: self.run(task=items[i][0], args=items[i][1], timeout=timeout), l_run)):
+                    l_rtn[i] = rtn_data
+                l_pending = l_wait
+        return l_rtn
+
+    def close(self):
+        pass
+
+
+def write_file_atomic(file_path, data: bytes):
+    path_tmp = f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(path_tmp, 'wb') as f:
+        f.write(data)
+    os.replace(path_tmp, file_path)
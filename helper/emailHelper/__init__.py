@@ -1 +1 @@
-from .emailhelper import send_email
+from .emailhelper import send_email, Mailer
@@ -5,6 +5,12 @@ from datetime import datetime
 import json
 import argparse
 import socket
+import time
+import threading
+import logging
+import atexit
+import weakref
+from functools import lru_cache
 
 # smtplib 用于邮件的发信动作
 import smtplib
@@ -22,28 +28,29 @@ def _read_config():
     return json.loads(open(path_config).read())
 
 
-def send_email(
-        email, pwd, host, port, to,
-        subject, text='', file='', filename='', **kwargs
-):
-    # d_config: dict = _read_config()
-    _from_addr = email
-    _pwd = pwd
-    _smtp_host = host
-    _smtp_port = port
-    _to_addr = to
+@lru_cache(maxsize=None)
+def get_host_identity() -> str:
+    """
+    本地IP, 只解析一次 (gethostbyname 可能阻塞在 DNS)
+    """
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except OSError:
+        return socket.gethostname()
+
 
+def _build_message(from_addr, to_addr: list, subject, text='', file='', filename='') -> MIMEMultipart:
     msg = MIMEMultipart('mixed')
     # 邮件头信息
-    msg['From'] = Header(_from_addr)
-    msg['To'] = Header(','.join(_to_addr))  # 收件人，多个收件人用逗号隔开
+    msg['From'] = Header(from_addr)
+    msg['To'] = Header(','.join(to_addr))  # 收件人，多个收件人用逗号隔开
     msg['Subject'] = Header(subject)        # 邮件主题
 
     # 构造文字内容
     # 邮箱正文内容，第一个参数为内容，第二个参数为格式(plain 为纯文本)，第三个参数为编码
     _ending_text = f'Time:  %s\nFrom:  %s' % (
         datetime.now().strftime('%Y/%m/%d %H:%M:%S'),   # 发送时间
-        socket.gethostbyname(socket.gethostname())      # 本地IP
+        get_host_identity()                             # 本地IP
     )
     text_plain = MIMEText(text + '\n\n' + _ending_text, 'plain', 'utf-8')
     msg.attach(text_plain)
@@ -62,6 +69,21 @@ def send_email(
         # 以下中文测试不ok
         # text_att["Content-Disposition"] = u'attachment; filename="中文附件.txt"'.decode('utf-8')
         msg.attach(text_att)
+    return msg
+
+
+def send_email(
+        email, pwd, host, port, to,
+        subject, text='', file='', filename='', **kwargs
+):
+    # d_config: dict = _read_config()
+    _from_addr = email
+    _pwd = pwd
+    _smtp_host = host
+    _smtp_port = port
+    _to_addr = to
+
+    msg = _build_message(_from_addr, _to_addr, subject, text=text, file=file, filename=filename)
 
     # 发送邮件
     # 开启发信服务，这里使用的是加密传输
@@ -75,6 +97,182 @@ def send_email(
     server.quit()
 
 
+def _is_connection_error(e: Exception) -> bool:
+    """
+    连接 断开 / socket 错误 时 重新连接; server 拒绝 (收件人 / 内容 / 限流) 等 SMTPException 不重试
+    (SMTPException 是 OSError 的子类)
+    """
+    if isinstance(e, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(e, smtplib.SMTPException):
+        return False
+    return isinstance(e, OSError)
+
+
+# 进程退出时 发送 所有 Mailer 的 digest
+_live_mailers = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_live_mailers():
+    for mailer in list(_live_mailers):
+        mailer.flush()
+
+
+class Mailer:
+    """
+    保持 已登录的 SMTP_SSL 连接, 连接断开时 重新连接;
+    digest_window 不为 None 时, alert() 在窗口内的邮件 合并为一封 发送
+
+    mailer = Mailer(**d_config, digest_window=60)
+    mailer.alert('xxx 断线', 'detail')
+    mailer.close()
+    """
+    def __init__(
+            self,
+            email, pwd, host, port, to,
+            digest_window: float or None = None,
+            max_digest_items=200,
+            keepalive=60.,
+            timeout=30.,
+            logger: logging.Logger or None = None,
+            **kwargs
+    ):
+        """
+        :param digest_window: alert 合并窗口 (s), None: 每个 alert 单独发送
+        :param max_digest_items: 一封汇总邮件 最多包含的 alert 数量, 达到后 立即发送
+        :param keepalive: 连接 空闲超过 keepalive 秒时, 发送前 用 NOOP 检查连接
+        """
+        self._from_addr = email
+        self._pwd = pwd
+        self._smtp_host = host
+        self._smtp_port = port
+        self._to_addr = to
+        self._digest_window = digest_window
+        self._max_digest_items = max_digest_items
+        self._keepalive = keepalive
+        self._timeout = timeout
+        if isinstance(logger, logging.Logger):
+            self.logger = logger
+        else:
+            self.logger = logging.Logger(name='Mailer')
+
+        self._server: smtplib.SMTP_SSL or None = None
+        self._t_last_used = 0.
+        self._lock = threading.Lock()
+        # digest
+        self._digest_lock = threading.Lock()
+        self._digest = []
+        self._digest_timer: threading.Timer or None = None
+        # 达到 max_digest_items 后 已启动 立即发送
+        self._digest_flush_now = False
+        if digest_window is not None:
+            _live_mailers.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _connect(self) -> smtplib.SMTP_SSL:
+        server = smtplib.SMTP_SSL(self._smtp_host, self._smtp_port, timeout=self._timeout)
+        server.login(self._from_addr, self._pwd)
+        return server
+
+    def _disconnect(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+
+    def _get_server(self) -> smtplib.SMTP_SSL:
+        if (self._server is not None) and (time.monotonic() - self._t_last_used > self._keepalive):
+            try:
+                if self._server.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected('noop fail')
+            except (smtplib.SMTPException, OSError):
+                self._disconnect()
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+
+    def send(self, subject, text='', file='', filename='', to: list or None = None):
+        to_addr = self._to_addr if to is None else to
+        msg = _build_message(self._from_addr, to_addr, subject, text=text, file=file, filename=filename)
+        with self._lock:
+            for n in range(2):
+                try:
+                    self._get_server().sendmail(self._from_addr, to_addr, msg.as_string())
+                except OSError as e:
+                    if not _is_connection_error(e):
+                        raise
+                    # 连接失效, 重新连接 一次
+                    self._disconnect()
+                    if n > 0:
+                        raise
+                    self.logger.warning(f'smtp reconnect: {e}')
+                else:
+                    self._t_last_used = time.monotonic()
+                    return
+
+    def alert(self, subject, text=''):
+        """
+        digest 模式下 只加入 汇总, 不阻塞
+        """
+        if self._digest_window is None:
+            self.send(subject, text)
+            return
+        with self._digest_lock:
+            self._digest.append((datetime.now(), subject, text))
+            if (len(self._digest) >= self._max_digest_items) and not self._digest_flush_now:
+                # 达到数量上限, 由 后台线程 立即发送
+                if self._digest_timer is not None:
+                    self._digest_timer.cancel()
+                self._digest_flush_now = True
+                self._start_digest_timer(0)
+            elif self._digest_timer is None:
+                self._start_digest_timer(self._digest_window)
+
+    def _start_digest_timer(self, delay):
+        # _digest_lock 内调用
+        self._digest_timer = threading.Timer(delay, self.flush)
+        self._digest_timer.daemon = True
+        self._digest_timer.start()
+
+    def flush(self):
+        """
+        发送 汇总邮件
+        """
+        with self._digest_lock:
+            l_alert, self._digest = self._digest, []
+            timer, self._digest_timer = self._digest_timer, None
+            self._digest_flush_now = False
+        if timer is not None:
+            timer.cancel()
+        if not l_alert:
+            return
+        if len(l_alert) == 1:
+            _, subject, text = l_alert[0]
+        else:
+            subject = f'[{len(l_alert)} alerts] {l_alert[0][1]}'
+            text = '\n\n'.join(
+                f'{dt.strftime("%Y/%m/%d %H:%M:%S")}  {s_subject}\n{s_text}'.rstrip()
+                for dt, s_subject, s_text in l_alert
+            )
+        try:
+            self.send(subject, text)
+        except Exception as e:
+            self.logger.error(f'send digest email fail: {e}')
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._disconnect()
+
+
 if __name__ == '__main__':
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('--subject', help='邮件主题', default='')
@@ -6,10 +6,14 @@ import shutil
 """
 
 import os
+import heapq
+import tempfile
+import itertools
 import datetime
 from collections import namedtuple, defaultdict
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Tuple
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # from .csvreader import HeaderCsvReader
 
@@ -101,6 +105,168 @@ class FileMatch:
             return d_match, False
 
 
+# 流式合并 的 读写缓冲
+STREAM_BUFFER_SIZE = 1024 * 1024
+STREAM_WRITE_LINES = 10000
+
+
+def iter_keyed_lines(
+        p, data_key_num: int, has_header=True, data_sperator: str = ",", check_sorted=True, encoding=None,
+) -> (str, Iterator[Tuple[str, str]]):
+    """
+    逐行读取 已按 key 排序的文件, 与 DataFileConcator.concat 相同的规则: 去掉首尾空白, 跳过空行, 相同 key 保留最后一行
+    :return: (header, iter((key, line), ))
+    """
+    f = open(p, encoding=encoding, buffering=STREAM_BUFFER_SIZE)
+    header = ''
+    if has_header:
+        header = f.readline()
+
+    def _iter():
+        with f:
+            last = None
+            for line in f:
+                line = line.strip()
+                if line == '':
+                    continue
+                _k = line.split(data_sperator)[data_key_num - 1]
+                if last is not None:
+                    if _k == last[0]:
+                        last = (_k, line)
+                        continue
+                    if check_sorted and (_k < last[0]):
+                        raise ValueError(f'文件未按 key 排序: {p}, {_k} < {last[0]}')
+                    yield last
+                last = (_k, line)
+            if last is not None:
+                yield last
+
+    return header, _iter()
+
+
+def merge_keyed_lines(iterables: List[Iterable[Tuple[str, str]]]) -> Iterator[Tuple[str, str]]:
+    """
+    k 路归并 多个 已排序 且 key 不重复 的 (key, line), 相同 key 保留 排在前面的 iterable 的行
+    """
+    def _with_priority(priority, it):
+        for _k, line in it:
+            yield _k, priority, line
+
+    last_key = None
+    for _k, _, line in heapq.merge(*[_with_priority(n, it) for n, it in enumerate(iterables)]):
+        if _k == last_key:
+            continue
+        last_key = _k
+        yield _k, line
+
+
+def write_lines_buffered(path_file_output, header: str, keyed_lines: Iterable[Tuple[str, str]]) -> str or None:
+    """
+    分批 写入, 内存只与 STREAM_WRITE_LINES 有关;
+    先写入 同目录的临时文件, 全部成功后 再替换 path_file_output, 读取出错 (如 未排序) 时 不留下不完整的文件
+    :return: 最后一个 key
+    """
+    last_key = None
+    path_tmp = path_file_output + '.tmp'
+    try:
+        with open(path_tmp, 'w', encoding='utf-8', buffering=STREAM_BUFFER_SIZE) as f:
+            if header:
+                f.write(header + '\n')
+            l_buf = []
+            for _k, line in keyed_lines:
+                l_buf.append(line)
+                last_key = _k
+                if len(l_buf) >= STREAM_WRITE_LINES:
+                    f.write('\n'.join(l_buf) + '\n')
+                    l_buf.clear()
+            if l_buf:
+                f.write('\n'.join(l_buf) + '\n')
+        os.replace(path_tmp, path_file_output)
+    except BaseException:
+        if os.path.exists(path_tmp):
+            os.remove(path_tmp)
+        raise
+    return last_key
+
+
+# 外部排序: 每个 run 的 估计额外内存 (每行, bytes) 与 一次归并的 最多 run 数
+SORT_ENTRY_OVERHEAD = 160
+EXTERNAL_SORT_FAN_IN = 64
+
+
+def _new_run_path(path_dir) -> str:
+    fd, path_run = tempfile.mkstemp(dir=path_dir, suffix='.run')
+    os.close(fd)
+    return path_run
+
+
+def split_sorted_runs(
+        p, data_key_num: int, has_header, data_sperator: str, memory_budget: int, path_dir,
+) -> (str, List[str]):
+    """
+    按 memory_budget 分段读取 未排序的文件, 每段 按 key 排序 后写入 path_dir 下的临时文件 (run);
+    段内 相同 key 保留最后一行
+    :return: (header, [run 路径, ]), run 按 在文件中的 先后顺序
+    """
+    def _spill(d_data):
+        path_run = _new_run_path(path_dir)
+        write_lines_buffered(path_run, '', ((_k, d_data[_k]) for _k in sorted(d_data)))
+        l_runs.append(path_run)
+
+    l_runs = []
+    with open(p, buffering=STREAM_BUFFER_SIZE) as f:
+        header = ''
+        if has_header:
+            header = f.readline()
+        d_data = {}
+        size = 0
+        for line in f:
+            line = line.strip()
+            if line == '':
+                continue
+            _k = line.split(data_sperator)[data_key_num - 1]
+            d_data[_k] = line
+            size += len(line) + len(_k) + SORT_ENTRY_OVERHEAD
+            if size >= memory_budget:
+                _spill(d_data)
+                d_data = {}
+                size = 0
+        if d_data:
+            _spill(d_data)
+    return header, l_runs
+
+
+def merge_runs(
+        l_runs: List[str], data_key_num: int, data_sperator: str, path_dir, fan_in=EXTERNAL_SORT_FAN_IN,
+) -> Iterator[Tuple[str, str]]:
+    """
+    归并 同一文件的 runs, 相同 key 保留 后面的 run 的行 (与 整个文件读入 dict 相同);
+    run 数量 超过 fan_in 时, 先将 相邻的 fan_in 个 归并为 中间 run, 限制同时打开的文件数
+    """
+    def _merge(l_paths):
+        return merge_keyed_lines([
+            # run 由 write_lines_buffered 写入, 为 utf-8
+            iter_keyed_lines(path, data_key_num, has_header=False, data_sperator=data_sperator, encoding='utf-8')[1]
+            for path in reversed(l_paths)
+        ])
+
+    l_runs = list(l_runs)
+    while len(l_runs) > fan_in:
+        l_merged = []
+        for i in range(0, len(l_runs), fan_in):
+            l_group = l_runs[i: i + fan_in]
+            if len(l_group) == 1:
+                l_merged.append(l_group[0])
+                continue
+            path_run = _new_run_path(path_dir)
+            write_lines_buffered(path_run, '', _merge(l_group))
+            for path in l_group:
+                os.remove(path)
+            l_merged.append(path_run)
+        l_runs = l_merged
+    return _merge(l_runs)
+
+
 class DataFileConcator:
     CONCAT_METHOD_OPTIONS = ['base', 'insert', 'all']
     MATCH_METHOD_OPTIONS = ['relpath', 'filename', 'foldername']
@@ -119,6 +285,8 @@ class DataFileConcator:
         self._insert_path = os.path.abspath(path_insert_folder)
         self._output_path = os.path.abspath(path_output)
         self._logger = logger
+        # 多进程时 失败的组 { match key: error }
+        self.group_errors: Dict[str, str] = {}
 
     """
     如何匹配文件：
@@ -144,42 +312,42 @@ class DataFileConcator:
             data_sperator: str = ",",
             match_method="foldername",  # 文件匹配方式，
             concat_method="base",       # 合并方法
+            stream=False,
+            memory_budget: int or None = None,
+            sort_tmp_root: str or None = None,
+            workers: int or None = None,
     ) -> dict:
         """
 
         :param match_method: str {'relpath', 'filename', 'foldername'}
         :param concat_method: str {'base', 'insert', 'all'}
+        :param stream: 输入文件 已按 key 排序 时, 逐行归并, 不读入整个文件 (需要 sort_by_key)
+        :param memory_budget: 外部排序 每段 使用的内存 (bytes), 用于 未排序 且 无法读入内存 的文件 (需要 sort_by_key);
+            与 stream 同时使用时, 先按已排序 归并, 发现未排序 再使用外部排序
+        :param sort_tmp_root: 外部排序 临时文件的目录, 默认为系统临时目录
+        :param workers: > 1 时 使用多进程 处理各组文件; 单组失败 记录在 self.group_errors, 不影响其他组
         :return:
 
         match_method : str {'relpath', 'filename', 'foldername'}
 
         """
 
-        def _read_file_data(p) -> (Dict[str, str], str) or (None, None):
-            with open(p) as f:
-                l_lines = f.readlines()
-            if len(l_lines) < 1:
-                return None, None
-            header = ''
-            if has_header:
-                header = l_lines[0]
-                l_lines = l_lines[1:]
-
-            d_data = {}
-            for line in l_lines:
-                line = line.strip()
-                if line == '':
-                    continue
-                _k = line.split(data_sperator)[data_key_num-1]
-                d_data[_k] = line
-            return d_data, header
-
         if concat_method not in self.CONCAT_METHOD_OPTIONS:
             print('FileConcator Error, arg "concat_method" not in %s' % self.CONCAT_METHOD_OPTIONS)
             raise Exception
         if match_method not in self.MATCH_METHOD_OPTIONS:
             print('FileConcator Error, arg "match_method" not in %s' % self.MATCH_METHOD_OPTIONS)
             raise Exception
+        if stream and not sort_by_key:
+            print('FileConcator Error, arg "stream" requires "sort_by_key"')
+            raise Exception
+        if memory_budget is not None:
+            if not sort_by_key:
+                print('FileConcator Error, arg "memory_budget" requires "sort_by_key"')
+                raise Exception
+            if memory_budget <= 0:
+                print('FileConcator Error, arg "memory_budget" must be positive')
+                raise Exception
 
         # 【1】查找文件
         # d_match: { match_method_A: { rootA: [fileA, fileB], rootB: [fileA, fielB], }, }
@@ -194,74 +362,282 @@ class DataFileConcator:
             os.system('pause')
 
         # 【2】遍历 读取 文件
+        d_kwargs = dict(
+            data_key_num=data_key_num, has_header=has_header, sort_by_key=sort_by_key, data_sperator=data_sperator,
+            concat_method=concat_method, stream=stream, memory_budget=memory_budget, sort_tmp_root=sort_tmp_root,
+        )
+        self.group_errors = {}
+        if (workers is not None) and (workers > 1):
+            return self._concat_parallel(d_match, workers, d_kwargs)
         file_last_key = {}
         for key, match_group in d_match.items():
-            # 2个文件的信息
-            if self._base_path not in match_group.keys():
-                self._logger.warning(f'此Key文件只存在于 insert 中，不存在于 base 中: {key}')
-                continue
-            base_file_info: FileRelpathInfo = match_group[self._base_path][0]
-            d_base_file_line, header = _read_file_data(base_file_info.path)
-            if not d_base_file_line:
-                self._logger.error('文件读取失败 %s' % base_file_info.path)
-                continue
+            file_last_key.update(self._concat_group(key, match_group, **d_kwargs))
+        return file_last_key
+
+    def _concat_parallel(self, d_match: dict, workers: int, d_kwargs: dict) -> dict:
+        file_last_key = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            d_future = {
+                executor.submit(
+                    _concat_group_worker,
+                    self._base_path, self._insert_path, self._output_path, self._logger.getEffectiveLevel(),
+                    key, dict(match_group), d_kwargs,
+                ): key
+                for key, match_group in d_match.items()
+            }
+            for future in as_completed(d_future):
+                key = d_future[future]
+                try:
+                    d_last_key, l_records, error = future.result()
+                except Exception as e:
+                    # 子进程 异常退出 等
+                    d_last_key, l_records, error = {}, [], f'{type(e).__name__}: {e}'
+                # 子进程的日志 由 本进程的 logger 输出
+                for record in l_records:
+                    self._logger.handle(record)
+                if error is not None:
+                    self.group_errors[key] = error
+                    self._logger.error(f'合并失败: {key}, {error}')
+                file_last_key.update(d_last_key)
+        if self.group_errors:
+            self._logger.error(f'{len(self.group_errors)}/{len(d_match)} 组 合并失败')
+        return file_last_key
+
+    def _concat_group(
+            self,
+            key, match_group: Dict[str, list],
+            data_key_num: int, has_header, sort_by_key, data_sperator, concat_method,
+            stream, memory_budget, sort_tmp_root,
+    ) -> dict:
+        """
+        合并 一组匹配的文件
+        :return: { 输出文件路径: 最后一个 key }
+        """
+
+        def _read_file_data(p) -> (Dict[str, str], str) or (None, None):
+            with open(p) as f:
+                l_lines = f.readlines()
+            if len(l_lines) < 1:
+                return None, None
+            header = ''
+            if has_header:
+                header = l_lines[0]
+                l_lines = l_lines[1:]
 
+            d_data = {}
+            for line in l_lines:
+                line = line.strip()
+                if line == '':
+                    continue
+                _k = line.split(data_sperator)[data_key_num-1]
+                d_data[_k] = line
+            return d_data, header
+
+        file_last_key = {}
+        # 2个文件的信息
+        if self._base_path not in match_group.keys():
+            self._logger.warning(f'此Key文件只存在于 insert 中，不存在于 base 中: {key}')
+            return file_last_key
+        base_file_info: FileRelpathInfo = match_group[self._base_path][0]
+        if stream or (memory_budget is not None):
+            path_insert_file = None
             if self._insert_path not in match_group.keys():
                 self._logger.warning(f'此Key文件只存在于 base 中，不存在于 insert 中: {key}')
-                # continue
-                d_insert_file_line = {}
             else:
-                insert_file_info: FileRelpathInfo = match_group[self._insert_path][0]
-                d_insert_file_line, _ = _read_file_data(insert_file_info.path)
-                if not d_insert_file_line:
-                    self._logger.error('文件读取失败: %s' % insert_file_info.path)
-                    # continue
-
-            # 【3】合并 / 输出
-            path_file_output = os.path.join(self._output_path, base_file_info.relpath)
-            if not os.path.isdir(os.path.dirname(path_file_output)):
-                os.makedirs(os.path.dirname(path_file_output))
-            if concat_method == 'base' or concat_method == 'insert':
-                if concat_method == 'base':
-                    base_key = list(d_base_file_line.keys()).copy()
-                    if d_insert_file_line:
-                        for k, v in d_insert_file_line.items():
-                            if k not in base_key:
-                                d_base_file_line[k] = v
-                elif concat_method == 'insert':
-                    d_base_file_line.update(d_insert_file_line)
-
-                # 输出
-                if sort_by_key:
-                    _keys = sorted(d_base_file_line)
+                path_insert_file = match_group[self._insert_path][0].path
+            last_key = None
+            if stream:
+                try:
+                    last_key = self._concat_stream(
+                        base_file_info, path_insert_file,
+                        data_key_num=data_key_num, has_header=has_header, data_sperator=data_sperator,
+                        concat_method=concat_method,
+                    )
+                except ValueError as e:
+                    if memory_budget is None:
+                        raise
+                    self._logger.warning(f'{e}, 使用外部排序')
                 else:
-                    _keys = d_base_file_line.keys()
-                l_output_lines = []
-                if header:
-                    l_output_lines.append(header + '\n')
-                for k in _keys:
-                    l_output_lines.append(d_base_file_line[k] + '\n')
-                with open(path_file_output, 'w', encoding='utf-8') as f:
-                    f.writelines(l_output_lines)
-                file_last_key[path_file_output] = max(_keys)
-            elif concat_method == 'all':
-                l_output_lines = []
-                if header:
-                    l_output_lines.append(header + '\n')
-
-                if sort_by_key:
-                    _keys_base = sorted(d_base_file_line)
-                    _keys_insert = sorted(d_insert_file_line)
+                    if last_key is not None:
+                        file_last_key[os.path.join(self._output_path, base_file_info.relpath)] = last_key
+                    return file_last_key
+            last_key = self._concat_external(
+                base_file_info, path_insert_file,
+                data_key_num=data_key_num, has_header=has_header, data_sperator=data_sperator,
+                concat_method=concat_method, memory_budget=memory_budget, sort_tmp_root=sort_tmp_root,
+            )
+            if last_key is not None:
+                file_last_key[os.path.join(self._output_path, base_file_info.relpath)] = last_key
+            return file_last_key
+
+        d_base_file_line, header = _read_file_data(base_file_info.path)
+        if not d_base_file_line:
+            self._logger.error('文件读取失败 %s' % base_file_info.path)
+            return file_last_key
+
+        if self._insert_path not in match_group.keys():
+            self._logger.warning(f'此Key文件只存在于 base 中，不存在于 insert 中: {key}')
+            # continue
+            d_insert_file_line = {}
+        else:
+            insert_file_info: FileRelpathInfo = match_group[self._insert_path][0]
+            d_insert_file_line, _ = _read_file_data(insert_file_info.path)
+            if not d_insert_file_line:
+                self._logger.error('文件读取失败: %s' % insert_file_info.path)
+                # continue
 
-                else:
-                    _keys_base = d_base_file_line.keys()
-                    _keys_insert = d_insert_file_line.keys()
-                for k in _keys_base:
-                    l_output_lines.append(d_base_file_line[k] + '\n')
-                for k in _keys_insert:
-                    l_output_lines.append(d_insert_file_line[k] + '\n')
-                with open(path_file_output, 'w', encoding='utf-8') as f:
-                    f.writelines(l_output_lines)
-                file_last_key[path_file_output] = max(max(_keys_base, _keys_insert))
+        # 【3】合并 / 输出
+        path_file_output = os.path.join(self._output_path, base_file_info.relpath)
+        # 多进程时 其他 group 可能同时创建
+        os.makedirs(os.path.dirname(path_file_output), exist_ok=True)
+        if concat_method == 'base' or concat_method == 'insert':
+            if concat_method == 'base':
+                base_key = list(d_base_file_line.keys()).copy()
+                if d_insert_file_line:
+                    for k, v in d_insert_file_line.items():
+                        if k not in base_key:
+                            d_base_file_line[k] = v
+            elif concat_method == 'insert':
+                d_base_file_line.update(d_insert_file_line)
+
+            # 输出
+            if sort_by_key:
+                _keys = sorted(d_base_file_line)
+            else:
+                _keys = d_base_file_line.keys()
+            l_output_lines = []
+            if header:
+                l_output_lines.append(header + '\n')
+            for k in _keys:
+                l_output_lines.append(d_base_file_line[k] + '\n')
+            with open(path_file_output, 'w', encoding='utf-8') as f:
+                f.writelines(l_output_lines)
+            file_last_key[path_file_output] = max(_keys)
+        elif concat_method == 'all':
+            l_output_lines = []
+            if header:
+                l_output_lines.append(header + '\n')
+
+            if sort_by_key:
+                _keys_base = sorted(d_base_file_line)
+                _keys_insert = sorted(d_insert_file_line)
+
+            else:
+                _keys_base = d_base_file_line.keys()
+                _keys_insert = d_insert_file_line.keys()
+            for k in _keys_base:
+                l_output_lines.append(d_base_file_line[k] + '\n')
+            for k in _keys_insert:
+                l_output_lines.append(d_insert_file_line[k] + '\n')
+            with open(path_file_output, 'w', encoding='utf-8') as f:
+                f.writelines(l_output_lines)
+            file_last_key[path_file_output] = max(max(_keys_base, _keys_insert))
         return file_last_key
 
+    def _concat_stream(
+            self,
+            base_file_info: FileRelpathInfo,
+            path_insert_file: str or None,
+            data_key_num: int, has_header, data_sperator, concat_method,
+    ) -> str or None:
+        """
+        :return: 输出文件的 最后一个 key, 失败时 None
+        """
+        header, it_base = iter_keyed_lines(
+            base_file_info.path, data_key_num, has_header=has_header, data_sperator=data_sperator)
+        first_base = next(it_base, None)
+        if first_base is None:
+            self._logger.error('文件读取失败 %s' % base_file_info.path)
+            return None
+        it_base = itertools.chain([first_base], it_base)
+        if path_insert_file is None:
+            it_insert = iter([])
+        else:
+            _, it_insert = iter_keyed_lines(
+                path_insert_file, data_key_num, has_header=has_header, data_sperator=data_sperator)
+
+        path_file_output = os.path.join(self._output_path, base_file_info.relpath)
+        # 多进程时 其他 group 可能同时创建
+        os.makedirs(os.path.dirname(path_file_output), exist_ok=True)
+        # 与 非流式 相同, header 行 保留原换行符 后 再加换行
+        return write_lines_buffered(path_file_output, header, self._merge_by_method(it_base, it_insert, concat_method))
+
+    def _concat_external(
+            self,
+            base_file_info: FileRelpathInfo,
+            path_insert_file: str or None,
+            data_key_num: int, has_header, data_sperator, concat_method,
+            memory_budget: int, sort_tmp_root: str or None,
+    ) -> str or None:
+        """
+        外部排序: 分段排序 写入临时文件, 再 k 路归并; 内存只与 memory_budget 有关
+        :return: 输出文件的 最后一个 key, 失败时 None
+        """
+        with tempfile.TemporaryDirectory(prefix='FileConcat_', dir=sort_tmp_root) as path_dir:
+            header, l_runs_base = split_sorted_runs(
+                base_file_info.path, data_key_num, has_header, data_sperator, memory_budget, path_dir)
+            if not l_runs_base:
+                self._logger.error('文件读取失败 %s' % base_file_info.path)
+                return None
+            it_base = merge_runs(l_runs_base, data_key_num, data_sperator, path_dir)
+            if path_insert_file is None:
+                it_insert = iter([])
+            else:
+                _, l_runs_insert = split_sorted_runs(
+                    path_insert_file, data_key_num, has_header, data_sperator, memory_budget, path_dir)
+                it_insert = merge_runs(l_runs_insert, data_key_num, data_sperator, path_dir)
+
+            path_file_output = os.path.join(self._output_path, base_file_info.relpath)
+            os.makedirs(os.path.dirname(path_file_output), exist_ok=True)
+            return write_lines_buffered(
+                path_file_output, header, self._merge_by_method(it_base, it_insert, concat_method))
+
+    @classmethod
+    def _merge_by_method(cls, it_base, it_insert, concat_method) -> Iterator[Tuple[str, str]]:
+        if concat_method == 'base':
+            return merge_keyed_lines([it_base, it_insert])
+        elif concat_method == 'insert':
+            return merge_keyed_lines([it_insert, it_base])
+        else:
+            return cls._chain_all(it_base, it_insert)
+
+    @staticmethod
+    def _chain_all(it_base, it_insert) -> Iterator[Tuple[str, str]]:
+        # 'all': base 全部 + insert 全部; 返回的 key 为 已输出的最大 key
+        last_key = None
+        for _k, line in itertools.chain(it_base, it_insert):
+            last_key = _k if last_key is None else max(last_key, _k)
+            yield last_key, line
+
+
+class _RecordListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.l_records: List[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord):
+        # args / exc_info 可能 无法 pickle, 先格式化
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.l_records.append(record)
+
+
+def _concat_group_worker(
+        base_path, insert_path, output_path, log_level, key, match_group: dict, d_kwargs: dict,
+) -> (dict, List[logging.LogRecord], str or None):
+    """
+    子进程中 合并一组文件
+    :return: (file_last_key, 日志, 错误)
+    """
+    handler = _RecordListHandler()
+    logger = logging.Logger(name='FileConcat', level=log_level)
+    logger.addHandler(handler)
+    concator = DataFileConcator(base_path, insert_path, output_path, logger=logger)
+    try:
+        d_last_key = concator._concat_group(key, match_group, **d_kwargs)
+    except Exception as e:
+        return {}, handler.l_records, f'{type(e).__name__}: {e}'
+    return d_last_key, handler.l_records, None
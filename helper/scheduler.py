@@ -1,8 +1,11 @@
 import datetime
 import time
 import abc
+import heapq
+import itertools
 import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor, Future
 
 
 class ScheduleRunner:
@@ -13,10 +16,82 @@ class ScheduleRunner:
     def __init__(self,
                  running_time=[[datetime.time(0, 0, 0), datetime.time(23, 59, 59)], ],
                  loop_interval=60 * 1, logger=logging.Logger('ScheduleRunner')):
+        """
+        :param running_time: [[start, end], ], start > end 时 表示跨越午夜, 如 [time(21), time(2, 30)]
+        """
         self._schedule_running_time = running_time
         self._schedule_in_running = False
         self._schedule_loop_interval = loop_interval
         self.logger = logger
+        self._schedule_stop_event = threading.Event()
+        # MultiScheduler overlap='cancel' 时 设置, _start / _end 可检查后 提前退出
+        self._schedule_cancel_event = threading.Event()
+
+    @staticmethod
+    def _is_in_time_range(time_now: datetime.time, start: datetime.time, end: datetime.time) -> bool:
+        # end 当秒 (end ~ end + 1s) 仍在区间内
+        time_now_second = time_now.replace(microsecond=0)
+        if start <= end:
+            return start <= time_now and time_now_second <= end
+        # 跨越午夜
+        return (time_now >= start) or (time_now_second <= end)
+
+    def _is_in_running_time(self, dt_now: datetime.datetime) -> bool:
+        time_now = dt_now.time()
+        return True in [
+            self._is_in_time_range(time_now, time_range[0], time_range[1])
+            for time_range in self._schedule_running_time
+        ]
+
+    def _next_transition(self, dt_now: datetime.datetime) -> datetime.datetime or None:
+        """
+        下一个 可能改变运行状态的时间: 某个区间的 start, 或 end 之后 (end 当秒 仍在区间内)
+        """
+        l_dt = []
+        for start, end in self._schedule_running_time:
+            for n_day in [0, 1]:
+                date = dt_now.date() + datetime.timedelta(days=n_day)
+                l_dt.append(datetime.datetime.combine(date, start))
+                l_dt.append(
+                    datetime.datetime.combine(date, end.replace(microsecond=0)) + datetime.timedelta(seconds=1))
+        l_dt = [dt for dt in l_dt if dt > dt_now]
+        return min(l_dt) if l_dt else None
+
+    def _update_running_state(self, is_in_running_time: bool):
+        # 开始
+        if (not self._schedule_in_running) and is_in_running_time:
+            self._schedule_in_running = True
+            self.logger.info('开始运行...')
+            self._start()
+        # 结束运行
+        elif self._schedule_in_running and (not is_in_running_time):
+            self._schedule_in_running = False
+            self.logger.info('暂停运行...')
+            self._end()
+
+    def start_event_loop(self, max_sleep=60 * 5):
+        """
+        计算 下一个 start / end 时间, 等待到该时间 再检查 (Event.wait 使用 monotonic 时钟);
+        每次最多等待 max_sleep 秒 后 重新计算, 以应对 系统时间调整
+        """
+        self.logger.info('启动运行...')
+        self._schedule_stop_event.clear()
+        while not self._schedule_stop_event.is_set():
+            dt_now = datetime.datetime.now()
+            self._update_running_state(self._is_in_running_time(dt_now))
+
+            dt_next = self._next_transition(datetime.datetime.now())
+            if dt_next is None:
+                wait = max_sleep
+            else:
+                wait = min(max((dt_next - datetime.datetime.now()).total_seconds(), 0), max_sleep)
+            self._schedule_stop_event.wait(wait)
+
+    def stop(self):
+        """
+        停止 start_event_loop
+        """
+        self._schedule_stop_event.set()
 
     @abc.abstractmethod
     def _start(self):
@@ -31,11 +106,7 @@ class ScheduleRunner:
         print('等待进入运行时间区间')
         # 初始化，用于检查上一次上传的时间，防止长时间没有上传
         while True:
-            time_now = datetime.datetime.now().time()
-            is_in_running_time = True in [
-                (time_now >= time_range[0]) and (time_now <= time_range[1])
-                for time_range in self._schedule_running_time
-            ]
+            is_in_running_time = self._is_in_running_time(datetime.datetime.now())
 
             # 运行时间中
             if self._schedule_in_running and is_in_running_time:
@@ -63,3 +134,217 @@ class ScheduleRunner:
 
             #
             time.sleep(self._schedule_loop_interval)
+
+
+class _JobMetrics:
+    def __init__(self):
+        self.runs = 0
+        self.errors = 0
+        self.skipped = 0
+        self.cancelled = 0
+        self.lateness_last = 0.
+        self.lateness_max = 0.
+        self.lateness_sum = 0.
+        self.duration_last = 0.
+        self.duration_max = 0.
+        self.duration_sum = 0.
+
+    def to_dict(self) -> dict:
+        return {
+            'runs': self.runs,
+            'errors': self.errors,
+            'skipped': self.skipped,
+            'cancelled': self.cancelled,
+            'lateness_last': self.lateness_last,
+            'lateness_max': self.lateness_max,
+            'lateness_avg': self.lateness_sum / self.runs if self.runs else 0.,
+            'duration_last': self.duration_last,
+            'duration_max': self.duration_max,
+            'duration_avg': self.duration_sum / self.runs if self.runs else 0.,
+        }
+
+
+class _Job:
+    def __init__(self, name, runner: ScheduleRunner, overlap):
+        self.name = name
+        self.runner = runner
+        self.overlap = overlap
+        # 可重入: add_done_callback / cancel 可能在 持有 lock 的线程中 立即调用 _on_done
+        self.lock = threading.RLock()
+        self.future: Future or None = None
+        # [(hook 名称, 计划时间), ]
+        self.pending = []
+        self.metrics = _JobMetrics()
+
+
+class MultiScheduler:
+    """
+    一个线程 调度多个 ScheduleRunner:
+        堆 按 下一个 start / end 时间 排序, 只在最近的时间 醒来;
+        _start / _end 在 线程池 中运行, 慢的 hook 不影响 其他 job 的调度
+    同一个 job 的 hook 仍在运行时 又到了下一个 hook, 按 overlap 处理:
+        'skip':   不运行 新的 hook
+        'queue':  等当前 hook 结束后 运行
+        'cancel': 设置 runner._schedule_cancel_event (hook 可检查后 提前退出), 结束后 只运行 最新的 hook
+
+    scheduler = MultiScheduler(max_workers=4)
+    scheduler.add_job(runner_a, overlap='queue')
+    scheduler.start()
+    """
+    OVERLAP_OPTIONS = ['skip', 'queue', 'cancel']
+
+    def __init__(self, max_workers=4, max_sleep=60 * 5, logger=logging.Logger('MultiScheduler')):
+        """
+        :param max_workers: 同时运行的 hook 数量
+        :param max_sleep: 最长等待时间, 以应对 系统时间调整
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='MultiScheduler')
+        self._max_sleep = max_sleep
+        self.logger = logger
+        # [(计划时间, seq, job), ]
+        self._heap = []
+        self._seq = itertools.count()
+        self._jobs = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread: threading.Thread or None = None
+
+    def add_job(self, runner: ScheduleRunner, name=None, overlap='skip'):
+        if overlap not in self.OVERLAP_OPTIONS:
+            raise ValueError(f'overlap not in {self.OVERLAP_OPTIONS}')
+        name = runner.__class__.__name__ if name is None else name
+        with self._condition:
+            if name in self._jobs:
+                raise ValueError(f'job already exists: {name}')
+            job = _Job(name, runner, overlap)
+            self._jobs[name] = job
+            # 立即检查一次 当前是否在运行时间
+            heapq.heappush(self._heap, (datetime.datetime.now(), next(self._seq), job))
+            self._condition.notify()
+
+    def remove_job(self, name):
+        with self._condition:
+            job = self._jobs.pop(name, None)
+            if job is not None:
+                self._heap = [item for item in self._heap if item[2] is not job]
+                heapq.heapify(self._heap)
+
+    def metrics(self) -> dict:
+        """
+        :return: { job name: {runs, errors, skipped, cancelled, lateness_*, duration_*} }, 单位 秒
+        """
+        with self._condition:
+            l_job = list(self._jobs.values())
+        d_metrics = {}
+        for job in l_job:
+            with job.lock:
+                d_metrics[job.name] = job.metrics.to_dict()
+        return d_metrics
+
+    def _run_hook(self, job: _Job, hook_name, dt_scheduled: datetime.datetime):
+        t_start = time.perf_counter()
+        lateness = max((datetime.datetime.now() - dt_scheduled).total_seconds(), 0.)
+        error = False
+        try:
+            getattr(job.runner, hook_name)()
+        except Exception as e:
+            error = True
+            self.logger.error(f'{job.name} {hook_name} error: {e}')
+        duration = time.perf_counter() - t_start
+        with job.lock:
+            m = job.metrics
+            m.runs += 1
+            m.errors += int(error)
+            m.lateness_last = lateness
+            m.lateness_max = max(m.lateness_max, lateness)
+            m.lateness_sum += lateness
+            m.duration_last = duration
+            m.duration_max = max(m.duration_max, duration)
+            m.duration_sum += duration
+
+    def _submit(self, job: _Job, hook_name, dt_scheduled):
+        # job.lock 内调用
+        job.runner._schedule_cancel_event.clear()
+        job.future = self._executor.submit(self._run_hook, job, hook_name, dt_scheduled)
+        job.future.add_done_callback(lambda future: self._on_done(job, future))
+
+    def _on_done(self, job: _Job, future: Future):
+        if future.cancelled():
+            # overlap='cancel' 取消 未开始的 hook, 由 _dispatch 提交新的 hook
+            return
+        with job.lock:
+            if job.pending and not self._stopped:
+                hook_name, dt_scheduled = job.pending.pop(0)
+                self._submit(job, hook_name, dt_scheduled)
+
+    def _dispatch(self, job: _Job, hook_name, dt_scheduled):
+        with job.lock:
+            if (job.future is None) or job.future.done():
+                self._submit(job, hook_name, dt_scheduled)
+                return
+            if job.overlap == 'skip':
+                job.metrics.skipped += 1
+                self.logger.warning(f'{job.name} 上一个 hook 仍在运行, 跳过 {hook_name}')
+            elif job.overlap == 'queue':
+                job.pending.append((hook_name, dt_scheduled))
+            else:
+                job.metrics.cancelled += 1
+                if job.future.cancel():
+                    # 还未开始运行
+                    self._submit(job, hook_name, dt_scheduled)
+                else:
+                    self.logger.warning(f'{job.name} 取消 正在运行的 hook, 之后运行 {hook_name}')
+                    job.runner._schedule_cancel_event.set()
+                    job.pending = [(hook_name, dt_scheduled)]
+
+    def _fire(self, job: _Job, dt_scheduled: datetime.datetime):
+        runner = job.runner
+        dt_now = datetime.datetime.now()
+        is_in_running_time = runner._is_in_running_time(dt_now)
+        if (not runner._schedule_in_running) and is_in_running_time:
+            runner._schedule_in_running = True
+            self.logger.info(f'{job.name} 开始运行...')
+            self._dispatch(job, '_start', dt_scheduled)
+        elif runner._schedule_in_running and (not is_in_running_time):
+            runner._schedule_in_running = False
+            self.logger.info(f'{job.name} 暂停运行...')
+            self._dispatch(job, '_end', dt_scheduled)
+        return runner._next_transition(dt_now)
+
+    def run_forever(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    if not self._heap:
+                        self._condition.wait(self._max_sleep)
+                        continue
+                    dt_next, _, job = self._heap[0]
+                    wait = (dt_next - datetime.datetime.now()).total_seconds()
+                    if wait <= 0:
+                        heapq.heappop(self._heap)
+                        break
+                    self._condition.wait(min(wait, self._max_sleep))
+                if self._stopped:
+                    return
+
+            dt_following = self._fire(job, dt_next)
+            with self._condition:
+                if self._jobs.get(job.name) is job:
+                    if dt_following is None:
+                        dt_following = datetime.datetime.now() + datetime.timedelta(seconds=self._max_sleep)
+                    heapq.heappush(self._heap, (dt_following, next(self._seq), job))
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name='MultiScheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """
+        停止调度, 不再运行 排队中的 hook; wait: 等待 正在运行的 hook 结束
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=wait)
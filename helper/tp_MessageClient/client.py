@@ -1,52 +1,25 @@
-import subprocess
 import datetime
 import os
-from enum import Enum
-from typing import Tuple
 import logging
 
 from .constant import MESSAGE_CLIENT_ADDRESS
+from ..PyMessageClient.constant import MCTask, MessageClientRtnData
+from ..PyMessageClient.engine import MessageEngine, RetryPolicy
 
 
-class RunException(Enum):
+def _run_mc(mc_ip, mc_port, task: MCTask, args: list, timeout, logger: logging.Logger, max_try: int,
+            transport: str = 'exe', retry_policy: RetryPolicy or None = None) -> MessageClientRtnData:
     """
+    与 PyMessageClient 使用同一个引擎: 指数退避重试, 同一 (ip, port) 共用熔断 / 统计
     """
-    TimeOut = 0
-    Error = -1
-    Success = 1
-
-
-def _run_mc(s_cmd, timeout, logger: logging.Logger) -> Tuple[RunException, str] or None:
-    p = subprocess.Popen(
-        s_cmd,
-        cwd=MESSAGE_CLIENT_ADDRESS,
-        stdout=subprocess.PIPE,
-        shell=True,
+    assert type(max_try) == int
+    if max_try < 1:
+        max_try = 1
+    engine = MessageEngine(
+        ip=mc_ip, port=mc_port, cwd=MESSAGE_CLIENT_ADDRESS, logger=logger,
+        transport=transport, retry_policy=retry_policy,
     )
-
-    try:
-        outs, errs = p.communicate(timeout=timeout)
-        output_s = str(outs, encoding="utf-8")
-    except subprocess.TimeoutExpired as e:
-        p.kill()
-        logger.error('调用 MessageClient 超时:')
-        logger.error(e)
-        return RunException.TimeOut, e
-        # outs, errs = p.commnuicate()
-    except Exception as e:
-        p.kill()
-        logger.error('调用 MessageClient 失败:')
-        logger.error(e)
-        return RunException.Error, e
-    else:
-        if 'Exception' in output_s:
-            p.kill()
-            logger.warning('调用 MessageClient 失败:')
-            logger.warning(output_s)
-            return RunException.TimeOut, output_s
-        else:
-            p.kill()
-            return None, output_s.strip()
+    return engine.run(task, args, timeout=timeout, max_try=max_try)
 
 
 # 上传
@@ -62,28 +35,11 @@ def send_file(mc_ip, mc_port, upload_name, path_target_file, timeout, logger: lo
     :param max_try:
     :return: None 代表运行失败
     """
-    assert type(max_try) == int
-
-    if max_try < 1:
-        max_try = 1
-
-    for n in range(max_try):
-        s_cmd = '''TradingPlatform.MessageClient.exe %s %s sendfile "%s" "%s" ''' % (
-            mc_ip, mc_port, upload_name, path_target_file)
-
-        error_type, msg = _run_mc(s_cmd=s_cmd, timeout=timeout, logger=logger)
-        if not error_type:
-            return datetime.datetime.now()
-        else:
-            if error_type == RunException.TimeOut:
-                logger.error(f'第{n+1}次运行，超时')
-                continue
-            if error_type == RunException.Error:
-                logger.error(f'第{n + 1}次运行，失败')
-                continue
-
-    logger.error('超过最大运行次数')
-    return None
+    mcr = _run_mc(mc_ip, mc_port, MCTask.SendFile, [upload_name, path_target_file],
+                  timeout=timeout, logger=logger, max_try=max_try)
+    if mcr.exception:
+        return None
+    return mcr.datetime
 
 
 def get_file(mc_ip, mc_port, file_key: str, output_root, timeout, logger: logging.Logger,
@@ -98,33 +54,16 @@ def get_file(mc_ip, mc_port, file_key: str, output_root, timeout, logger: loggin
     :param max_try:
     :return: None 代表运行失败
     """
-    assert type(max_try) == int
-
     if not os.path.exists(output_root):
         os.mkdir(output_root)
 
-    if max_try < 1:
-        max_try = 1
-
     path_file_output = os.path.join(output_root, file_key)
-    for n in range(max_try):
-        s_cmd = '''TradingPlatform.MessageClient.exe %s %s getfile "%s" "%s" ''' % (
-            mc_ip, mc_port, file_key, path_file_output)
-
-        error_type, return_msg = _run_mc(s_cmd=s_cmd, timeout=timeout, logger=logger)
-        if not error_type:
-            # logger.info(f'downloaded {file_key}')
-            return datetime.datetime.now()
-        else:
-            # exception_type, exception_string = error_msg
-            if error_type == RunException.TimeOut:
-                logger.error(f'第{n + 1}次运行，超时')
-                continue
-            if error_type == RunException.Error:
-                logger.error(f'第{n + 1}次运行，失败')
-                continue
-    logger.error(f'超过最大运行次数, download: {file_key}')
-    return None
+    mcr = _run_mc(mc_ip, mc_port, MCTask.GetFile, [file_key, path_file_output],
+                  timeout=timeout, logger=logger, max_try=max_try)
+    if mcr.exception:
+        logger.error(f'download fail: {file_key}')
+        return None
+    return mcr.datetime
 
 
 def get_message(mc_ip, mc_port, message_key: str, timeout, logger: logging.Logger,
@@ -138,23 +77,16 @@ def get_message(mc_ip, mc_port, message_key: str, timeout, logger: logging.Logge
     :param max_try:
     :return: None 代表运行失败
     """
-    assert type(max_try) == int
-
-    if max_try < 1:
-        max_try = 1
-
-    for n in range(max_try):
-        s_cmd = '''TradingPlatform.MessageClient.exe %s %s getmessage "%s"''' % (
-            mc_ip, mc_port, message_key)
-        # print(s_cmd)
-
-        error_type, msg = _run_mc(s_cmd=s_cmd, timeout=timeout, logger=logger)
-        # print(msg)
-        if error_type:
-            logger.error(msg)
-            continue
-        if msg:
-            return msg.split('<<')[1]
+    # 与 原实现 相同, 返回为空 时 也重试; 失败的重试 由 _run_mc 处理
+    for n in range(max(max_try, 1)):
+        mcr = _run_mc(mc_ip, mc_port, MCTask.GetMessage, [message_key],
+                      timeout=timeout, logger=logger, max_try=max(max_try - n, 1))
+        if mcr.exception:
+            logger.error(f'download fail: {message_key}')
+            return None
+        if mcr.msg:
+            return mcr.msg
+        logger.error(f'第{n + 1}次运行，返回为空')
     logger.error(f'超过最大运行次数, download: {message_key}')
     return None
 
@@ -171,27 +103,11 @@ def send_message(mc_ip, mc_port, key, msg, timeout, logger: logging.Logger,
     :param max_try:
     :return: None 代表运行失败
     """
-    assert type(max_try) == int
-
-    if max_try < 1:
-        max_try = 1
-
-    for n in range(max_try):
-        s_cmd = '''TradingPlatform.MessageClient.exe %s %s sendmessage "%s" "%s"''' % (
-            mc_ip, mc_port, key, msg)
-        error_type, msg = _run_mc(s_cmd=s_cmd, timeout=timeout, logger=logger)
-        if not error_type:
-            return datetime.datetime.now()
-        else:
-            # exception_type, exception_string = error_msg
-            if error_type == RunException.TimeOut:
-                logger.error(f'第{n+1}次运行，超时')
-                continue
-            if error_type == RunException.Error:
-                logger.error(f'第{n + 1}次运行，失败')
-                continue
-    logger.error('超过最大运行次数')
-    return None
+    mcr = _run_mc(mc_ip, mc_port, MCTask.SendMessage, [key, msg],
+                  timeout=timeout, logger=logger, max_try=max_try)
+    if mcr.exception:
+        return None
+    return mcr.datetime
 
 
 def status():
@@ -1 +1,2 @@
 from .warning_board import run_warning_board
+from .dispatcher import WarningDispatcher, dispatch_warning
@@ -0,0 +1,191 @@
+"""
+WarningBoard 后台发送
+
+    warn() 只放入队列, 不阻塞调用方; 后台线程 调用 run_warning_board:
+        相同的 message 第一次 立即发送, 之后 coalesce_window 秒内的重复 合并为一条 'message ×N';
+        所有 message 共用 令牌桶 限速 (max_per_minute, burst), 没有令牌时 继续合并, 不丢弃;
+        队列满时 丢弃, 丢弃的数量 作为一条警告 发送
+
+    dispatcher = WarningDispatcher()
+    dispatcher.warn('xxx 断线')
+    ...
+    dispatcher.stop()
+"""
+
+import time
+import queue
+import atexit
+import threading
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict
+
+from .warning_board import run_warning_board
+
+
+_STOP = object()
+
+
+class _Pending:
+    __slots__ = ('count', 'window_end')
+
+    def __init__(self, count, window_end):
+        # window 内 未发送的 次数
+        self.count = count
+        self.window_end = window_end
+
+
+class WarningDispatcher:
+    def __init__(
+            self,
+            coalesce_window=10.,
+            max_per_minute=20,
+            burst=5,
+            max_queue=10000,
+            sender: Callable[[str], None] or None = None,
+            logger: logging.Logger or None = None,
+    ):
+        """
+        :param coalesce_window: 相同 message 的 合并窗口 (s)
+        :param max_per_minute: 每分钟 最多调用 WarningBoard 的次数
+        :param burst: 令牌桶 容量
+        :param sender: sender(message), 默认 run_warning_board
+        """
+        self._window = coalesce_window
+        self._rate = max_per_minute / 60.
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._t_tokens = time.monotonic()
+        self._sender = run_warning_board if sender is None else sender
+        if isinstance(logger, logging.Logger):
+            self.logger = logger
+        else:
+            self.logger = logging.Logger(name='WarningDispatcher')
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending: Dict[str, _Pending] = OrderedDict()
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self._dropped_reported = 0
+        self.sent = 0
+        self._thread = threading.Thread(target=self._loop, name='WarningDispatcher', daemon=True)
+        self._thread.start()
+
+    def warn(self, warning_msg: str):
+        """
+        不阻塞; 队列满时 丢弃
+        """
+        try:
+            self._queue.put_nowait(str(warning_msg))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def stop(self, timeout=None):
+        """
+        发送 队列中 及 合并中 的所有 message (不限速) 后 退出; 可重复调用
+        """
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _take_token(self, now) -> bool:
+        self._tokens = min(self._burst, self._tokens + (now - self._t_tokens) * self._rate)
+        self._t_tokens = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _send(self, warning_msg: str):
+        try:
+            self._sender(warning_msg)
+            self.sent += 1
+        except Exception as e:
+            self.logger.error(f'WarningBoard 发送失败: {e}')
+
+    @staticmethod
+    def _format(warning_msg, count) -> str:
+        return warning_msg if count == 1 else f'{warning_msg} ×{count}'
+
+    def _add(self, warning_msg: str, now):
+        pending = self._pending.get(warning_msg)
+        if pending is not None:
+            pending.count += 1
+        elif self._take_token(now):
+            self._send(warning_msg)
+            self._pending[warning_msg] = _Pending(count=0, window_end=now + self._window)
+        else:
+            self._pending[warning_msg] = _Pending(count=1, window_end=now + self._window)
+
+    def _flush_due(self, now, force=False):
+        for warning_msg in list(self._pending.keys()):
+            pending = self._pending[warning_msg]
+            if (pending.window_end > now) and not force:
+                continue
+            if pending.count == 0:
+                del self._pending[warning_msg]
+            elif force or self._take_token(now):
+                self._send(self._format(warning_msg, pending.count))
+                # 仍在重复时 开始新的窗口
+                pending.count = 0
+                pending.window_end = now + self._window
+                if force:
+                    del self._pending[warning_msg]
+        with self._lock:
+            dropped = self.dropped - self._dropped_reported
+        if dropped and (force or self._take_token(now)):
+            self._send(f'WarningBoard 队列已满, 丢弃 {dropped} 条警告')
+            self._dropped_reported += dropped
+
+    def _wait_time(self, now) -> float or None:
+        if not self._pending:
+            return None
+        l_wait = [pending.window_end - now for pending in self._pending.values()]
+        wait = min(l_wait)
+        if wait <= 0:
+            # 等待 令牌
+            wait = (1 - self._tokens) / self._rate if self._rate > 0 else 1.
+        return min(max(wait, 0.01), 1.)
+
+    def _loop(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._wait_time(time.monotonic()))
+            except queue.Empty:
+                item = None
+            now = time.monotonic()
+            if item is _STOP:
+                # 队列中 剩余的 message
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        self._add(item, now)
+                self._flush_due(now, force=True)
+                return
+            if item is not None:
+                self._add(item, now)
+            self._flush_due(now)
+
+
+# 进程退出时 等待 发送剩余 message 的 最长时间 (s)
+DEFAULT_STOP_TIMEOUT = 30.
+_default_dispatcher: WarningDispatcher or None = None
+_default_lock = threading.Lock()
+
+
+def dispatch_warning(warning_msg: str):
+    """
+    使用 进程内共享的 WarningDispatcher 发送, 不阻塞; 进程退出时 发送 剩余的 message
+    """
+    global _default_dispatcher
+    if _default_dispatcher is None:
+        with _default_lock:
+            if _default_dispatcher is None:
+                _default_dispatcher = WarningDispatcher()
+                atexit.register(_default_dispatcher.stop, DEFAULT_STOP_TIMEOUT)
+    _default_dispatcher.warn(warning_msg)
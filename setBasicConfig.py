@@ -1,156 +1,216 @@
-import time
 import json
-import hmac
-import hashlib
-import requests
-from urllib.parse import urljoin, urlencode
 import os
 import sys
 import argparse
+import logging
 from pprint import pprint
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 PATH_ROOT = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(PATH_ROOT)
 
-from bntools.common import BINANCE_BASE_URL
+from bntools import BinanceClient, BinanceException, SymbolChange, SymbolRegistry, fetch_symbols_state, diff_symbols
 from helper.simpleLogger import MyLogger
 
 # 參數輸入
 arg_parser = argparse.ArgumentParser()
 arg_parser.add_argument('-i', '--input', )
-args = arg_parser.parse_args()
-PATH_INPUT_FILE = os.path.abspath(args.input)
-assert os.path.isfile(PATH_INPUT_FILE)
-
-
-class BinanceException(Exception):
-    def __init__(self, status_code, data):
-        self.status_code = status_code
-        if data:
-            self.code = data['code']
-            self.msg = data['msg']
-        else:
-            self.code = None
-            self.msg = None
-        message = f"{status_code} [{self.code}] {self.msg}"
-        super().__init__(message)
-
-
-def set_position_mode(use_hedge_mode: bool = False):
-    method_url = '/v1/positionSide/dual'
-    timestamp = int(time.time() * 1000)
-    params = {
-        'dualSidePosition': use_hedge_mode,
-        'timestamp': timestamp
-    }
-    query_string = urlencode(params)
-    params['signature'] = hmac.new(SECRET_KEY.encode('utf-8'), query_string.encode('utf-8'), hashlib.sha256).hexdigest()
-
-    url = BASE_URL + method_url
-    r = requests.post(url, headers=HEADERS, params=params)
-    if r.status_code == 200:
-        data = r.json()
-        print(json.dumps(data, indent=2))
-    elif 'no need to change' in r.json()['msg'].lower():
-        print('no need to change')
-    else:
-        raise BinanceException(status_code=r.status_code, data=r.json())
-
+arg_parser.add_argument('-w', '--workers', type=int, default=1, help='并发修改 symbol 的线程数, 1 为顺序执行')
+arg_parser.add_argument('-r', '--reconcile', action='store_true', help='先读取账户当前设置, 只修改不一致的部分')
+arg_parser.add_argument('-a', '--accounts', help='批量模式, 账户列表文件 (json list, 格式同 Config.json), 默认为 Config/Config.json')
+arg_parser.add_argument('--account-workers', type=int, default=4, help='批量模式下 并行的账户数')
 
-def set_margin_mode(symbol, margin_type='CROSSED', ):
-    assert margin_type.upper() in ['CROSSED', 'ISOLATED']
 
-    method_url = '/v1/marginType'
-    timestamp = int(time.time() * 1000)
-    params = {
-        'symbol': symbol,
-        'marginType': margin_type.upper(),
-        'timestamp': timestamp
-    }
-    query_string = urlencode(params)
-    params['signature'] = hmac.new(SECRET_KEY.encode('utf-8'), query_string.encode('utf-8'), hashlib.sha256).hexdigest()
-
-    url = BASE_URL + method_url
-    r = requests.post(url, headers=HEADERS, params=params)
-
-    if r.status_code == 200:
-        data = r.json()
-        print(json.dumps(data, indent=2))
-    elif 'no need to change' in r.json()['msg'].lower():
+def _print_result(data):
+    if data is None:
         print('no need to change')
     else:
-        raise BinanceException(status_code=r.status_code, data=r.json())
-
-
-def set_leverage(symbol, leverage=5,):
-    method_url = '/v1/leverage'
-    timestamp = int(time.time() * 1000)
-    params = {
-        'symbol': symbol,
-        'leverage': leverage,
-        'timestamp': timestamp
-    }
-    query_string = urlencode(params)
-    params['signature'] = hmac.new(SECRET_KEY.encode('utf-8'), query_string.encode('utf-8'), hashlib.sha256).hexdigest()
-
-    url = BASE_URL + method_url
-    r = requests.post(url, headers=HEADERS, params=params)
-    if r.status_code == 200:
-        data = r.json()
         print(json.dumps(data, indent=2))
-    elif 'no need to change' in r.json()['msg'].lower():
-        print('no need to change')
-    else:
-        raise BinanceException(status_code=r.status_code, data=r.json())
 
 
-if __name__ == '__main__':
+def set_symbol_config(client: BinanceClient, exchange, change: SymbolChange, logger):
+    # 同一 symbol 必须先修改 margin mode, 再修改 leverage
     #
-    PATH_ACCOUNT_CONFIG = os.path.join(os.path.join(PATH_ROOT, 'Config', 'Config.json'))
-    assert os.path.isfile(PATH_ACCOUNT_CONFIG)
-    d_account_config = json.loads(open(PATH_ACCOUNT_CONFIG, encoding='utf-8').read())
-    API_KEY = d_account_config['apiKey']
-    SECRET_KEY = d_account_config['secret']
-
-    HEADERS = {
-        'X-MBX-APIKEY': API_KEY
-    }
-    logger = MyLogger('set_basic_config', output_root=os.path.join(PATH_ROOT, 'logs'))
+    # r = exchange.set_margin_mode('cross', CHECKING_SYMBOL)
+    if change.margin_type is not None:
+        logger.info(f'set margin mode, {change.symbol}, {change.margin_type}')
+        _print_result(client.set_margin_mode(exchange, symbol=change.symbol, margin_type=change.margin_type))
 
-    # 读取输入
-    d_setting_info = json.loads(open(PATH_INPUT_FILE, encoding='utf-8').read())
+    #
+    # r = exchange.set_leverage(5, CHECKING_SYMBOL)
+    if change.leverage is not None:
+        logger.info(f'set leverage, {change.symbol}, {change.leverage}')
+        _print_result(client.set_leverage(exchange, leverage=change.leverage, symbol=change.symbol))
+
+
+def set_symbols_config(client: BinanceClient, exchange, changes: list, logger, workers=1) -> dict:
+    """
+    workers > 1 时, 不同 symbol 并发修改
+    :param changes: [SymbolChange, ]
+    :return: { symbol: Exception } 修改失败 (或因限频取消) 的 symbol
+    """
+    if workers <= 1:
+        for change in changes:
+            set_symbol_config(client, exchange, change, logger)
+        return {}
+
+    d_error = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        d_future = {
+            executor.submit(set_symbol_config, client, exchange, change, logger): change.symbol
+            for change in changes
+        }
+        for future in as_completed(d_future):
+            symbol = d_future[future]
+            if future.cancelled():
+                d_error[symbol] = Exception('cancelled')
+                continue
+            try:
+                future.result()
+            except Exception as e:
+                d_error[symbol] = e
+                logger.error(f'{exchange} {symbol} 修改失败: {e}')
+                # 触发限频 / 封禁, 不再提交剩余 symbol
+                if isinstance(e, BinanceException) and e.status_code in [418, 429]:
+                    for _future in d_future:
+                        _future.cancel()
+    return d_error
+
+
+def _get_account_logger(logger: logging.Logger, account_name) -> logging.Logger:
+    # 共用 handler, 以 logger name 区分账户
+    account_logger = logging.Logger(name=f'{logger.name}.{account_name}', level=logger.level)
+    for handler in logger.handlers:
+        account_logger.addHandler(handler)
+    return account_logger
+
+
+def set_account_config(d_account_config: dict, d_setting_info: dict, logger: logging.Logger, workers=1,
+                       reconcile=False) -> dict:
+    """
+    修改一个账户, 每个账户使用独立的 client (连接池 / 签名 / 限频)
+    :return: 修改报告
+        {'account': , 'error': None or str, 'exchanges': {exchange: {'symbols': , 'changes': , 'errors': }}}
+    """
+    account_name = d_account_config.get('name', d_account_config['apiKey'][:8])
+    d_report = {'account': account_name, 'error': None, 'exchanges': {}}
 
     # 参数
     _margin_type = d_setting_info['config']['margin_mode']
     _leverage = int(d_setting_info['config']['leverage'])
     _position_mode_use_hedge = d_setting_info['config']['position_mode_use_hedge']
-    assert _margin_type.upper() in ['CROSSED', 'ISOLATED']
-    assert type(_position_mode_use_hedge) is bool
 
-    # 修改
-    for _item_info in d_setting_info['items']:
-        _exchange = _item_info['exchange']
-        _symbols = _item_info['symbols']
+    client = BinanceClient(
+        api_key=d_account_config['apiKey'], secret_key=d_account_config['secret'],
+        pool_size=max(10, workers), logger=logger,
+    )
+    try:
+        with client:
+            # 转换 / 校验 symbol, 全部通过后 再开始修改
+            symbol_registry = SymbolRegistry(client, cache_root=os.path.join(PATH_ROOT, 'cache'), logger=logger)
+            l_exchange_symbols = []
+            l_symbol_error = []
+            for _item_info in d_setting_info['items']:
+                _exchange_symbols, _errors = symbol_registry.normalize(
+                    _item_info['exchange'], _item_info['symbols'], leverage=_leverage)
+                l_exchange_symbols.append(_exchange_symbols)
+                l_symbol_error += _errors
+            if l_symbol_error:
+                for _error in l_symbol_error:
+                    logger.error(_error)
+                raise Exception('symbol 校验失败')
+
+            # 修改
+            for _item_info, _symbols in zip(d_setting_info['items'], l_exchange_symbols):
+                _exchange = _item_info['exchange']
+
+                print('\n\n')
+                logger.info(f'changing {_exchange} ...')
+
+                _need_position_mode = True
+                if reconcile:
+                    # 先读后写, 只修改不一致的部分
+                    _changes = diff_symbols(
+                        fetch_symbols_state(client, _exchange), _symbols, margin_type=_margin_type, leverage=_leverage)
+                    _need_position_mode = client.get_position_mode(_exchange) != _position_mode_use_hedge
+                    logger.info(f'reconcile, {len(_changes)} / {len(_symbols)} symbols need to change')
+                else:
+                    _changes = [
+                        SymbolChange(symbol=_symbol, margin_type=_margin_type, leverage=_leverage)
+                        for _symbol in _symbols
+                    ]
+
+                d_symbol_error = set_symbols_config(client, _exchange, _changes, logger=logger, workers=workers)
+                d_report['exchanges'][_exchange] = {
+                    'symbols': len(_symbols),
+                    'changes': len(_changes),
+                    'errors': {symbol: str(e) for symbol, e in d_symbol_error.items()},
+                }
+                if d_symbol_error:
+                    raise Exception(f'{_exchange} 修改失败: {", ".join(d_symbol_error.keys())}')
+
+                # set hedged to True or False for a market
+                logger.info(f'set position mode, {["One-way", "Hedge"][int(_position_mode_use_hedge)]}')
+                if _need_position_mode:
+                    _print_result(client.set_position_mode(_exchange, use_hedge_mode=_position_mode_use_hedge))
+                else:
+                    print('no need to change')
+    except Exception as e:
+        logger.error(f'{account_name} 修改失败: {e}')
+        d_report['error'] = str(e)
+    return d_report
 
-        BASE_URL = BINANCE_BASE_URL[_exchange]
-        print('\n\n')
-        logger.info(f'changing {_exchange} ...')
 
-        for _symbol in _symbols:
-            #
-            # r = exchange.set_margin_mode('cross', CHECKING_SYMBOL)
-            logger.info(f'set margin mode, {_symbol}, {_margin_type}')
-            set_margin_mode(symbol=_symbol, margin_type=_margin_type)
+if __name__ == '__main__':
+    args = arg_parser.parse_args()
+    PATH_INPUT_FILE = os.path.abspath(args.input)
+    assert os.path.isfile(PATH_INPUT_FILE)
+    WORKERS = max(1, args.workers)
+    RECONCILE = args.reconcile
+    PATH_ACCOUNTS_FILE = os.path.abspath(args.accounts) if args.accounts else None
+    ACCOUNT_WORKERS = max(1, args.account_workers)
 
-            #
-            # r = exchange.set_leverage(5, CHECKING_SYMBOL)
-            logger.info(f'set leverage, {_symbol}, {_leverage}')
-            set_leverage(leverage=_leverage, symbol=_symbol)
+    #
+    if PATH_ACCOUNTS_FILE:
+        # 批量模式
+        assert os.path.isfile(PATH_ACCOUNTS_FILE)
+        l_account_config = json.loads(open(PATH_ACCOUNTS_FILE, encoding='utf-8').read())
+        assert type(l_account_config) is list
+    else:
+        PATH_ACCOUNT_CONFIG = os.path.join(os.path.join(PATH_ROOT, 'Config', 'Config.json'))
+        assert os.path.isfile(PATH_ACCOUNT_CONFIG)
+        l_account_config = [json.loads(open(PATH_ACCOUNT_CONFIG, encoding='utf-8').read())]
 
-        # set hedged to True or False for a market
-        logger.info(f'set position mode, {["One-way", "Hedge"][int(_position_mode_use_hedge)]}')
-        set_position_mode(use_hedge_mode=_position_mode_use_hedge)
+    logger = MyLogger('set_basic_config', output_root=os.path.join(PATH_ROOT, 'logs'))
 
-    logger.info('Finished')
+    # 读取输入
+    d_setting_info = json.loads(open(PATH_INPUT_FILE, encoding='utf-8').read())
+
+    # 参数
+    assert d_setting_info['config']['margin_mode'].upper() in ['CROSSED', 'ISOLATED']
+    assert type(d_setting_info['config']['position_mode_use_hedge']) is bool
 
+    # 修改
+    if len(l_account_config) == 1:
+        l_report = [set_account_config(l_account_config[0], d_setting_info, logger, WORKERS, RECONCILE)]
+    else:
+        with ThreadPoolExecutor(max_workers=ACCOUNT_WORKERS) as account_executor:
+            l_report = list(account_executor.map(
+                lambda d_account: set_account_config(
+                    d_account, d_setting_info,
+                    _get_account_logger(logger, d_account.get('name', d_account['apiKey'][:8])),
+                    WORKERS, RECONCILE,
+                ),
+                l_account_config
+            ))
+
+    # 报告
+    l_failed = [d_report['account'] for d_report in l_report if d_report['error']]
+    for d_report in l_report:
+        logger.info(json.dumps(d_report, ensure_ascii=False))
+    if l_failed:
+        logger.error(f'{len(l_failed)} / {len(l_report)} 账户修改失败: {", ".join(l_failed)}')
+        raise Exception
+
+    logger.info('Finished')